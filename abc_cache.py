@@ -0,0 +1,78 @@
+''' memoize MusicState -> ABC conversion, keyed on the fields that affect it '''
+
+from collections import OrderedDict
+import hashlib
+import json
+from pathlib import Path
+import threading
+
+from atomic import atomic_write_text
+
+ABC_FIELDS = ('notes', 'lyrics', 'key', 'time', 'break_bars', 'notes_abc')
+DEFAULT_CACHE_DIR = Path('.cache/abc')
+
+
+def piece_key(piece: dict, salt: str = '') -> str:
+    canonical = json.dumps({k: piece.get(k) for k in ABC_FIELDS},
+                           sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256((salt + canonical).encode('utf-8')).hexdigest()
+
+
+class AbcCache:
+    ''' Bounded in-process LRU in front of a directory of one-file-per-piece
+        ABC strings that survives restarts.  `convert_fn(piece)` is only
+        called on a miss in both.
+
+        `salt` should change whenever the conversion code does.
+    '''
+
+    def __init__(self, convert_fn, salt: str = '', cache_dir: Path = DEFAULT_CACHE_DIR,
+                 maxsize: int = 4096):
+        self.convert_fn = convert_fn
+        self.salt = salt
+        self.cache_dir = Path(cache_dir)
+        self.maxsize = maxsize
+        self.memory: OrderedDict[str, str] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f'{key}.abc'
+
+    def _remember(self, key: str, abc: str) -> None:
+        with self.lock:
+            self.memory[key] = abc
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.maxsize:
+                self.memory.popitem(last=False)
+
+    def abc_for(self, piece: dict) -> str:
+        key = piece_key(piece, self.salt)
+        with self.lock:
+            abc = self.memory.get(key)
+            if abc is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return abc
+
+        disk_path = self._disk_path(key)
+        try:
+            abc = disk_path.read_text(encoding='utf-8')
+            self.disk_hits += 1
+        except FileNotFoundError:
+            abc = self.convert_fn(piece)
+            self.misses += 1
+            try:
+                disk_path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write_text(disk_path, abc)
+            except OSError as e:
+                print(f"Could not write ABC cache entry {disk_path}: {e}")
+
+        self._remember(key, abc)
+        return abc
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'size': len(self.memory)}
@@ -1,43 +1,171 @@
+from dataclasses import asdict
 import datetime
+import html as html_lib
 import json
-from flask import Flask, request
+import os
+from pathlib import Path
+import time
+from flask import Flask, Response, g, request, make_response, jsonify
 
-from render import format_music
-from parse import parse_music, MusicState
+from atomic import atomic_write_text
+from metrics import metrics
+from midi import DEFAULT_TEMPO, MIDI_DIR, midi_salt, write_midi, write_midi_file
+
+from render import format_music, stream_music
+from parse import LiveCatalog, abc_cache, piece_diagnostics, stream_catalog
+from page_cache import PageCache
+from save_log import FIELDS, SaveError, SaveLog
+from search import index_catalog, query_grams
+from titles import TitleIndex, read_incipit_lines
+from images import extract_svgs
+from watch import CatalogWatcher
 
 app = Flask(__name__, static_folder='static')
 
+
+save_log = SaveLog()
+live_catalog = LiveCatalog(save_log)
+COMPACT_EVERY = 50  # saves
+search_index = None
+title_index = None
+# set TEFILLOT_TRACE_DIR to keep a Chrome trace of every page build
+TRACE_DIR = os.environ.get('TEFILLOT_TRACE_DIR')
+# app.py --watch (or TEFILLOT_WATCH=1): push edits to open pages as they are saved
+watcher = CatalogWatcher(live_catalog) if os.environ.get('TEFILLOT_WATCH') else None
+# TEFILLOT_STREAM=1 (or /?stream=1): render the page as it is sent, for
+# collections too big to hold in memory
+STREAM = os.environ.get('TEFILLOT_STREAM')
+
+
+def build_page():
+    global search_index, title_index
+    with metrics.trace('build') as trace:
+        print("Parsing music")
+        with metrics.span('parse'):
+            if watcher is not None:
+                catalog, generation = watcher.check()
+            else:
+                catalog, generation = live_catalog.refresh(), None
+        with metrics.span('search_index'):
+            search_index = index_catalog(catalog)
+        title_index = TitleIndex(read_incipit_lines())
+        with metrics.span('midi'):
+            midi = {number: f'{MIDI_DIR.as_posix()}/{name}' for number, name in write_midi(catalog).items()}
+        print("Formatting music")
+        with metrics.span('format'):
+            page = format_music(catalog, midi=midi, live=generation)
+    if TRACE_DIR:
+        stamp = datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y%m%dT%H%M%S.%f')
+        Path(TRACE_DIR).mkdir(parents=True, exist_ok=True)
+        atomic_write_text(Path(TRACE_DIR) / f'build-{stamp}.json', trace.chrome_json())
+    return page
+
+page_cache = PageCache(build_page)
+
+
+def stream_page():
+    salt = midi_salt(DEFAULT_TEMPO)
+
+    def midi_url(version):
+        if not version.music_fields:
+            return None
+        return f'{MIDI_DIR.as_posix()}/{write_midi_file(version.music_fields, salt=salt)}'
+    return stream_music(stream_catalog(), midi_url=midi_url)
+
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe('tefillot_request_seconds', time.perf_counter() - g.started,
+                    route=route, method=request.method)
+    metrics.inc('tefillot_requests_total', route=route, method=request.method,
+                status=response.status_code)
+    return response
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route("/metrics/trace")
+def last_trace():
+    ''' the last page build as a Chrome trace (chrome://tracing, Perfetto) '''
+    if metrics.last_trace is None:
+        return jsonify(errors=["no page has been built yet"]), 404
+    return Response(metrics.last_trace.chrome_json(), mimetype='application/json')
+
+
 @app.route("/")
 def hello_world():
-    print("Parsing music")
-    parse_music()
-    print("Formatting music")
-    format_music()
-    with open('index.html', 'r', encoding='utf-8') as f:
-        s = f.read()
-    return s
+    if STREAM or request.args.get('stream') == '1':
+        return Response(stream_page(), mimetype='text/html')
+    page, etag = page_cache.get()
+    response = make_response(page)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+@app.route("/events")
+def events():
+    ''' row updates for a page rendered in watch mode, as server-sent events '''
+    if watcher is None:
+        return jsonify(errors=["the server isn't running with --watch"]), 404
+    return Response(watcher.stream(request.args.get('generation', type=int)),
+                    mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route("/search")
+def search():
+    ''' /search?notes=d4 e f g a[&key=Dm][&rhythm=0]: incipits ranked by
+        how well they contain that melody, in any key '''
+    page_cache.get()  # brings search_index up to date
+    grams, errors = query_grams(request.args.get('notes', ''), request.args.get('key') or 'C')
+    if errors or not grams:
+        return jsonify(errors=[str(e) for e in errors] or ["need at least three notes"]), 400
+    return jsonify(search_index.search(grams, rhythm=request.args.get('rhythm') != '0'))
+
+
+@app.route("/titles")
+def titles():
+    ''' /titles?q=vsham: canonical incipit titles for the editor, prefix
+        matches first, spelling variants folded together '''
+    page_cache.get()  # brings title_index up to date
+    return jsonify(title_index.lookup(request.args.get('q', '')))
 
 
 @app.route('/p', methods=['POST'])
 def post_back():
-    with open('expanded.html', 'wb') as f:
-        f.write(request.data)
+    # save the page and carve out its SVGs in one pass over the upload
+    chunks = iter(lambda: request.stream.read(1 << 16), b'')
+    with metrics.span('svg_extract'):
+        extractor = extract_svgs(chunks, copy_to='expanded.html')
+    print(f"{extractor.written} SVGs written, {extractor.unchanged} unchanged")
     return "ok"
 
 
 @app.route('/abc', methods=['GET'])
 def abc():
-    arg_dict = {k: request.args.get(k)
-                for k in ('time', 'key', 'notes', 'lyrics', 'book', 'page', 'title', 'composer', 'nb')}
-    music = MusicState(arg_dict)
+    arg_dict = {k: request.args.get(k) for k in FIELDS}
     saved_msg = ''
     if request.args.get('save') == '1':
-        arg_dict['timestamp'] = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
-        with open("saves.json", "a") as f:
-            print(json.dumps(arg_dict), file=f)
-        saved_msg = f'<h3>Saved to disk at {arg_dict["timestamp"]}</h3>'
+        try:
+            entry = save_log.append(arg_dict)
+        except SaveError as e:
+            saved_msg = '<h3>Not saved:</h3><ul>' + ''.join(
+                f'<li>{html_lib.escape(error)}</li>' for error in e.errors) + '</ul>'
+        else:
+            if save_log.appended % COMPACT_EVERY == 0:
+                print("Compacted saves.json: %d entries, %d kept" % save_log.compact())
+            page_cache.invalidate()
+            saved_msg = f'<h3>Saved to disk at {entry["timestamp"]}</h3>'
 
-    abc_str = music.abc().replace('\\n', '\n')
+    abc_str = abc_cache.abc_for(arg_dict).replace('\\n', '\n')
     html = """<script src="static/abcjs_basic_5.9.1-min.js" type="text/javascript"></script>
 <meta charset="utf-8">
 <link href="static/audio.css" media="all" rel="stylesheet" type="text/css" />
@@ -53,7 +181,44 @@ def abc():
   }""" + f"make('test', {json.dumps(abc_str)});\n</script>" + saved_msg
     return html; # music.abc()
 
+
+def convert_piece(piece) -> dict:
+    if not isinstance(piece, dict):
+        return {'error': "expected an object with notes, lyrics, key, time, ..."}
+    try:
+        abc_str = abc_cache.abc_for(piece).replace('\\n', '\n')
+        diagnostics = piece_diagnostics(piece)
+    except Exception as e:  # one bad piece shouldn't sink the whole batch
+        return {'error': f"{type(e).__name__}: {e}"}
+    return {'abc': abc_str,
+            'diagnostics': [dict(asdict(d), message=str(d)) for d in diagnostics]}
+
+
+@app.route('/abc/batch', methods=['POST'])
+def abc_batch():
+    ''' POST a JSON array of pieces (the fields MusicState reads); get back
+        [{"abc": ..., "diagnostics": [...]}, ...] in the same order.  With
+        ?stream=1 the results come back one JSON object per line, as each
+        is converted. '''
+    pieces = request.get_json(silent=True)
+    if not isinstance(pieces, list):
+        return jsonify(errors=["expected a JSON array of pieces"]), 400
+    if request.args.get('stream') == '1':
+        def generate():
+            for piece in pieces:
+                yield json.dumps(convert_piece(piece)) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
+    return jsonify([convert_piece(piece) for piece in pieces])
+
+
 if __name__ == "__main__":
+  import argparse
+  parser = argparse.ArgumentParser(description="Serve the catalog")
+  parser.add_argument('--watch', action='store_true',
+                      help="watch data/, incipits.txt and saves.json and update open pages in place")
+  args = parser.parse_args()
+  if args.watch:
+    watcher = watcher or CatalogWatcher(live_catalog)
   app.run(debug=True, port=8000)
 
 '''
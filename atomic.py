@@ -0,0 +1,35 @@
+''' write-then-rename helpers, so readers never see a half-written file '''
+
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import tempfile
+
+# mkstemp creates files readable only by us; give the result the mode of
+# the file it replaces, or else the mode a plain open() would have (a
+# process-wide umask can only be read by setting it)
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
+
+@contextmanager
+def atomic_open(path, mode='w', encoding='utf-8'):
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent or '.', prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else encoding) as f:
+            yield f
+        try:
+            file_mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            file_mode = 0o666 & ~UMASK
+        os.chmod(tmp_name, file_mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def atomic_write_text(path, text: str) -> None:
+    with atomic_open(path, 'w') as f:
+        f.write(text)
@@ -0,0 +1,288 @@
+''' benchmark every stage of the build on synthetic catalogs
+
+    python bench.py [--scales 1 10 100] [--tracemalloc] [--skip svg_to_drawing ...]
+
+For each scale a synthetic catalog that many times the size of data/ is
+generated (deterministically) in a scratch directory: every real piece
+plus scale-1 variants of it in made-up books, with some pitches nudged,
+accidentals and triplets sprinkled in, and FK links back to the
+original (or to a synthetic PK).  The stages then run there from cold
+caches, one after the other, each feeding the next.
+
+Results are printed and appended as one JSON line per run to
+bench_results.jsonl, so runs can be compared over time.  Nothing touches
+the network.  Stages whose optional dependencies (svglib, reportlab)
+aren't installed are reported as skipped.
+
+max_rss is the process's peak resident size so far, after each stage.
+With --tracemalloc each stage also gets its own peak of Python
+allocations, at the cost of slower (and so not comparable) timings.
+'''
+
+from contextlib import contextmanager
+import datetime
+import io
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from tokenizer import NOTES_SCANNER, NOTE_PARTS
+
+REPO = Path(__file__).resolve().parent
+RESULTS_PATH = REPO / 'bench_results.jsonl'
+DEFAULT_SCALES = (1, 10, 100)
+
+
+def mutate_notes(notes: str, rng: random.Random) -> str:
+    ''' nudge some pitches, add some accidentals and triplets; the result
+        is still valid notes syntax '''
+    def one(m):
+        if m.lastgroup != 'note':
+            return m.group()
+        (open_paren, triplet, octave, letter, accidental,
+         duration, dot, close_paren, break_beam) = (part or '' for part in m.group(*NOTE_PARTS))
+        if letter != 'r':
+            if rng.random() < 0.15:
+                letter = 'abcdefg'[('abcdefg'.index(letter) + rng.choice((-1, 1))) % 7]
+            if not accidental and rng.random() < 0.05:
+                accidental = rng.choice('+-@')
+        if not triplet and duration == '8' and not dot and rng.random() < 0.05:
+            triplet = '&3'
+        # (a note match takes the spaces after it, which are kept)
+        spaces = m.group()[len(m.group().rstrip(' ')):]
+        return f"{open_paren}{triplet}{octave}{letter}{accidental}{duration}{dot}{close_paren}{break_beam}{spaces}"
+    return NOTES_SCANNER.sub(one, notes)
+
+
+def generate_catalog(out_dir: Path, scale: int, seed: int = 0) -> dict[str, int]:
+    ''' write out_dir/data/*.yaml, incipits.txt and an empty saves.json '''
+    rng = random.Random(seed)
+    (out_dir / 'data').mkdir(parents=True)
+    shutil.copy(REPO / 'incipits.txt', out_dir / 'incipits.txt')
+    (out_dir / 'saves.json').write_text('', encoding='utf-8')
+    counts = {'files': 0, 'pieces': 0, 'links': 0}
+    for yaml_path in sorted((REPO / 'data').glob('*.yaml')):
+        with yaml_path.open(encoding='utf-8') as f:
+            y = yaml.safe_load(f)
+        originals = y.get('Music') or []
+        synthetic_pks = {}
+        if scale > 1:
+            for j, piece in enumerate(originals):
+                if 'PK' not in piece and 'FK' not in piece and rng.random() < 0.2:
+                    synthetic_pks[j] = f'bench_{yaml_path.stem}_{j}'
+        for copy in range(scale):
+            music = []
+            for j, original in enumerate(originals):
+                piece = dict(original)
+                if copy == 0:
+                    if j in synthetic_pks:
+                        piece['PK'] = synthetic_pks[j]
+                else:
+                    if 'notes' in piece:
+                        piece['notes'] = mutate_notes(str(piece['notes']), rng)
+                    pk = piece.pop('PK', None) or synthetic_pks.get(j)
+                    if pk is not None and 'FK' not in piece:
+                        piece['FK'] = pk
+                        counts['links'] += 1
+                music.append(piece)
+            book = y.get('Book', yaml_path.stem)
+            out = dict(y, Book=book if copy == 0 else f'{book} #{copy}', Music=music)
+            with (out_dir / 'data' / f'{yaml_path.stem}_{copy}.yaml').open('w', encoding='utf-8') as f:
+                yaml.safe_dump(out, f, allow_unicode=True, sort_keys=False)
+            counts['files'] += 1
+            counts['pieces'] += len(music)
+    return counts
+
+
+@contextmanager
+def working_dir(path: Path):
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+def max_rss_kib() -> int | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+# yaml_load and parse_music feed everything else, so always run
+SKIPPABLE = ('note_parsing', 'abc_generation', 'tsv_write', 'stream_tsv', 'html_render',
+             'svg_engrave', 'svg_extract', 'svg_to_drawing', 'pdf_layout')
+
+
+class Bench:
+    def __init__(self, use_tracemalloc: bool = False, skip=()):
+        self.use_tracemalloc = use_tracemalloc
+        self.skip = set(skip)
+        self.stages: dict[str, dict] = {}
+
+    def run(self, name: str, fn, items_of=len):
+        ''' time fn(); items_of(result) is the number of things it handled '''
+        if name in self.skip:
+            self.stages[name] = {'skipped': 'by request'}
+            print(f"  {name:16} skipped")
+            return None
+        if self.use_tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except ImportError as e:
+            self.stages[name] = {'skipped': str(e)}
+            print(f"  {name:16} skipped ({e})")
+            return None
+        finally:
+            seconds = time.perf_counter() - start
+            if self.use_tracemalloc:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        items = items_of(result)
+        stage = {
+            'seconds': round(seconds, 4),
+            'items': items,
+            'items_per_second': round(items / seconds, 1) if seconds else None,
+            'max_rss_kib': max_rss_kib(),
+        }
+        if self.use_tracemalloc:
+            stage['peak_alloc_kib'] = peak // 1024
+        self.stages[name] = stage
+        print(f"  {name:16} {seconds:9.3f} s  {items:7} items  {stage['items_per_second'] or 0:10.1f}/s"
+              + (f"  peak {stage['peak_alloc_kib']} KiB" if self.use_tracemalloc else ''))
+        return result
+
+
+def bench_scale(scale: int, use_tracemalloc: bool = False, skip=()) -> dict:
+    # imported here so the generator above doesn't pay for them
+    from flask import Flask
+    import parse
+    from catalog import write_tsv
+    from engrave import engrave_catalog
+    from images import extract_svgs
+    from render import format_music
+
+    with tempfile.TemporaryDirectory(prefix=f'tefillot-bench-{scale}x-') as tmp:
+        tmp = Path(tmp)
+        generated = generate_catalog(tmp, scale)
+        print(f"{scale}x: {generated['pieces']} pieces in {generated['files']} files")
+        bench = Bench(use_tracemalloc, skip)
+        with working_dir(tmp):
+            # start every scale from cold caches
+            parse.abc_cache.memory.clear()
+
+            def load_yaml():
+                pieces = []
+                for path in sorted(Path('data').glob('*.yaml')):
+                    pieces.extend(parse.load_yaml(path)['Music'])
+                return pieces
+            pieces = bench.run('yaml_load', load_yaml)
+
+            states = bench.run('note_parsing', lambda: [parse.MusicState(dict(p)) for p in pieces])
+            if states is not None:
+                bench.run('abc_generation', lambda: [s.abc() for s in states])
+            else:
+                bench.stages['abc_generation'] = {'skipped': 'needs note_parsing'}
+            del states
+
+            def build_catalog():
+                parsed = parse.load_parsed_music(use_cache=False)
+                return parse.build_catalog(parsed, parse.incipit_order(parsed))
+            catalog = bench.run('parse_music', build_catalog, lambda c: sum(1 for _ in c.versions()))
+            versions = sum(1 for _ in catalog.versions())
+
+            bench.run('tsv_write', lambda: catalog.write_tsv('x.tsv'), lambda _: versions)
+            # the same x.tsv from parse.stream_catalog; with --tracemalloc its
+            # peak should stay put as the scale grows
+            bench.run('stream_tsv', lambda: write_tsv('x.tsv', parse.stream_catalog()), lambda _: versions)
+
+            app = Flask('bench', template_folder=str(REPO / 'Templates'))
+            with app.app_context():
+                bench.run('html_render', lambda: format_music(catalog), lambda _: versions)
+
+            engraved = bench.run('svg_engrave', lambda: engrave_catalog(catalog, Path('Images')),
+                                 lambda counts: counts['written'])
+
+            def post_back():
+                doc = io.BytesIO()
+                doc.write(b'<html><body><table>')
+                for path in sorted(Path('Images').glob('notation*.svg')):
+                    doc.write(f'<tr><td><div id="{path.stem}">'.encode('utf-8'))
+                    doc.write(path.read_bytes())
+                    doc.write(b'</div></td></tr>')
+                doc.write(b'</table></body></html>')
+                doc.seek(0)
+                return extract_svgs(iter(lambda: doc.read(1 << 16), b''), out_dir='Extracted')
+            bench.run('svg_extract', post_back, lambda e: e.written)
+
+            def to_drawings():
+                from svg_rl import load_drawings
+                return load_drawings(catalog.versions())
+            drawings = bench.run('svg_to_drawing', to_drawings)
+
+            def layout():
+                from svg_rl import get_doc, story_for
+                out = io.BytesIO()
+                get_doc(out).build(story_for(catalog.entries(), drawings))
+                return out.getvalue()
+            if drawings is not None:
+                bench.run('pdf_layout', layout, lambda _: len(drawings))
+            else:
+                bench.stages['pdf_layout'] = {'skipped': 'no drawings'}
+
+        return {'generated': generated, 'engraved': engraved, 'stages': bench.stages}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Time each build stage on synthetic catalogs")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES),
+                        help="catalog sizes, as multiples of data/ (default 1 10 100)")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="also record each stage's peak Python allocations (slows every stage)")
+    parser.add_argument('--skip', nargs='+', default=[], choices=SKIPPABLE, metavar='STAGE',
+                        help="leave these stages out (the PDF ones take longest)")
+    parser.add_argument('--out', default=str(RESULTS_PATH))
+    args = parser.parse_args()
+
+    run = {
+        'timestamp': datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'tracemalloc': args.tracemalloc,
+        'skipped': args.skip,
+        'scales': {},
+    }
+    for scale in args.scales:
+        run['scales'][str(scale)] = bench_scale(scale, args.tracemalloc, args.skip)
+    with open(args.out, 'a', encoding='utf-8') as f:
+        print(json.dumps(run), file=f)
+    print(f"Results appended to {args.out}")
@@ -0,0 +1,188 @@
+''' incremental, section-parallel build of tefilot.pdf
+
+    Each "# section" of incipits.txt is laid out on its own, in a worker
+    process, into .cache/sections/<hash>.pdf.  The hash covers the
+    section's headings, composers, sources and the bytes of the SVGs it
+    draws (not the notation numbers, so inserting a piece doesn't
+    invalidate every later section), plus the layout code itself; after an
+    edit only the sections that changed are laid out again.
+
+    The fragments are stitched behind the front matter and a generated
+    table of contents, and the running page numbers are stamped on last,
+    in the same place svg_rl.addPageNumbers puts them.
+
+    Stitching needs pypdf; without it we fall back to svg_rl.example(),
+    which lays out the whole book in one pass.
+'''
+
+import hashlib
+import io
+from pathlib import Path
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Paragraph, PageBreak
+
+from atomic import atomic_open
+from catalog import Catalog, Section
+from parse import load_catalog, parse_music
+from svg_rl import boilerplate, example, get_doc, load_drawings, story_for
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = PdfWriter = None
+
+SECTION_CACHE_DIR = Path('.cache/sections')
+LAYOUT_SOURCES = ('svg_rl.py', 'book.py')
+
+TOC_STYLE = ParagraphStyle('toc', fontSize=9, leading=11)
+
+
+def layout_hash() -> str:
+    h = hashlib.sha256()
+    for name in LAYOUT_SOURCES:
+        h.update(Path(name).read_bytes())
+    return h.hexdigest()
+
+
+def svg_path(version) -> Path:
+    return Path(f'Images/notation{version.number}.svg')
+
+
+def fragment_key(sections: list[Section], layout: str) -> str:
+    h = hashlib.sha256(layout.encode('utf-8'))
+    for section in sections:
+        for kind, value in section.entries():
+            if kind == 'notation':
+                h.update(repr((kind, value.composer, value.source_lines())).encode('utf-8'))
+                try:
+                    h.update(hashlib.sha256(svg_path(value).read_bytes()).digest())
+                except FileNotFoundError:
+                    h.update(b'no svg')
+            else:
+                h.update(repr((kind, value)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def fragments(catalog: Catalog) -> list[list[Section]]:
+    ''' Group the sections into independently laid out fragments.
+        A heading is only flushed to the page along with the next drawing
+        (see story_for), so sections without any SVG ride along with the
+        following one, and trailing ones are dropped, as in the one-pass
+        build. '''
+    groups = []
+    pending = []
+    for section in catalog.sections:
+        pending.append(section)
+        if any(svg_path(v).exists() for v in section.versions()):
+            groups.append(pending)
+            pending = []
+    return groups
+
+
+def build_fragment(job: tuple[list[Section], str]) -> str:
+    ''' lay out one fragment, without page numbers; runs in a worker process '''
+    sections, pdf_path = job
+    drawings = load_drawings([v for s in sections for v in s.versions()])
+    story = []
+    for section in sections:
+        story.extend(story_for(section.entries(), drawings))
+    pdf_path = Path(pdf_path)
+    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = pdf_path.with_suffix('.tmp')
+    get_doc(str(tmp_path), page_numbers=False).build(story)
+    tmp_path.replace(pdf_path)
+    return str(pdf_path)
+
+
+def front_matter(toc: list[tuple[str, int]]) -> bytes:
+    ''' boilerplate plus the table of contents, as a PDF '''
+    styles = getSampleStyleSheet()
+    story = []
+    boilerplate(story)
+    story.append(Paragraph('Contents', styles['Heading1']))
+    for title, page in toc:
+        story.append(Paragraph(f'{title} <font color="grey">.....</font> {page}', TOC_STYLE))
+    story.append(PageBreak())
+    out = io.BytesIO()
+    get_doc(out, page_numbers=False).build(story)
+    return out.getvalue()
+
+
+def page_numbers(count: int) -> bytes:
+    ''' `count` blank pages carrying just "Page N" '''
+    out = io.BytesIO()
+    canvas = Canvas(out, pagesize=letter)
+    for page in range(1, count + 1):
+        canvas.setFont('Times-Roman', 9)
+        canvas.drawString(72*4, 0.55 * 72, f"Page {page}")
+        canvas.showPage()
+    canvas.save()
+    return out.getvalue()
+
+
+def build_book(catalog: Catalog, pdf_path='tefilot.pdf', workers: int = 1) -> dict[str, int]:
+    if PdfWriter is None:
+        print("pypdf is not installed; laying out the whole book in one pass")
+        example(catalog, workers=workers)
+        return {}
+
+    layout = layout_hash()
+    groups = fragments(catalog)
+    paths = [SECTION_CACHE_DIR / f'{fragment_key(g, layout)}.pdf' for g in groups]
+    jobs = [(g, str(p)) for g, p in zip(groups, paths) if not p.exists()]
+    counts = {'sections': len(groups), 'cached': len(groups) - len(jobs), 'built': len(jobs)}
+    print(f"Sections: {counts['cached']} cached, {counts['built']} to lay out")
+
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(build_fragment, jobs))
+    else:
+        for job in jobs:
+            build_fragment(job)
+
+    readers = [PdfReader(p) for p in paths]
+
+    # the contents pages shift everything after them, so lay them out
+    # until their own length stops changing (in practice, twice)
+    front_pages = 1
+    while True:
+        toc = []
+        page = front_pages + 1
+        for group, reader in zip(groups, readers):
+            toc.extend((s.title, page) for s in group if s.title is not None)
+            page += len(reader.pages)
+        front = PdfReader(io.BytesIO(front_matter(toc)))
+        if len(front.pages) == front_pages:
+            break
+        front_pages = len(front.pages)
+
+    writer = PdfWriter()
+    for reader in [front] + readers:
+        for pdf_page in reader.pages:
+            writer.add_page(pdf_page)
+    numbers = PdfReader(io.BytesIO(page_numbers(len(writer.pages))))
+    for pdf_page, number in zip(writer.pages, numbers.pages):
+        pdf_page.merge_page(number)
+    for title, page in toc:
+        writer.add_outline_item(title, page - 1)
+
+    with atomic_open(pdf_path, 'wb') as f:
+        writer.write(f)
+    counts['pages'] = len(writer.pages)
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Build tefilot.pdf section by section, reusing unchanged sections")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="lay out changed sections in this many processes")
+    parser.add_argument('--out', default='tefilot.pdf')
+    parser.add_argument('--catalog', help="a catalog snapshot (as build.py writes) to lay out instead of parsing")
+    args = parser.parse_args()
+    catalog = load_catalog(args.catalog) if args.catalog else parse_music(tsv_path=None)
+    print(build_book(catalog, args.out, workers=args.workers))
@@ -0,0 +1,291 @@
+''' the whole build as a graph of stages, each skipped when nothing it reads changed
+
+    python build.py [pdf site publish ...] [--workers 4] [--force] [--dry-run]
+
+    catalog   data/*.yaml, saves.json, incipits.txt -> x.tsv
+    site      catalog -> site/ and static/midi/ (export.py)
+    svg       catalog -> Images/notation*.svg (engrave.py)
+    pdf       catalog, svg -> tefilot.pdf (book.py)
+    publish   site, pdf -> the web server (rsync and scp)
+
+With no targets, everything but publish is built.  A stage runs only if
+the content of one of its inputs (data, templates, or the code that does
+the work) or of what an upstream stage produced has changed since its last
+successful run, or its outputs are missing or were changed by hand.  What
+a stage "produced" is the hash of its output files, except for the
+catalog, where it is the hash of the whole parsed catalog, so an edit that
+doesn't change the music (a YAML comment, say) stops there.  The catalog
+stage also leaves a snapshot of what it built in .cache/, and the site,
+svg and pdf stages read that (--catalog) rather than parsing again.
+
+Files are re-hashed only when their size or mtime changes; those hashes
+and each stage's last run are kept in .cache/build.json.  Stages whose
+inputs are ready run at the same time, each in its own process, and their
+output is printed when they finish.  A timing summary comes last.
+'''
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+import hashlib
+import json
+from pathlib import Path
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable
+
+from atomic import atomic_write_text
+
+STATE_PATH = Path('.cache/build.json')
+CATALOG_SNAPSHOT = Path('.cache/build-catalog.pickle')
+STATE_VERSION = 1
+PUBLISH_TO = 'ghweb:tefillot/'
+# (parse.CODE_MODULES, spelled out so a build with nothing to do needn't
+# import the parser)
+PARSE_CODE = ('parse.py', 'catalog.py', 'tokenizer.py', 'theory.py', 'titles.py',
+              'save_log.py', 'abc_cache.py', 'catalog_cache.py')
+# what stages that read the notes themselves (MIDI, engraving) depend on
+MUSIC_CODE = ('parse.py', 'tokenizer.py', 'theory.py')
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable                   # run(build) -> printed output
+    deps: tuple[str, ...] = ()
+    inputs: tuple[str, ...] = ()    # glob patterns
+    outputs: tuple[str, ...] = ()   # glob patterns
+    default: bool = True            # built when no targets are named
+
+
+def command(script: str, parallel: bool = False) -> Callable:
+    ''' a stage that runs `python script` on the catalog stage's snapshot,
+        with --workers if it takes it '''
+    def run(build) -> str:
+        cmd = [sys.executable, script, '--catalog', str(CATALOG_SNAPSHOT)]
+        cmd += ['--workers', str(build.workers)] if parallel else []
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if result.returncode != 0:
+            raise StageError(result.stdout + f"\n{script} exited with {result.returncode}")
+        return result.stdout
+    return run
+
+
+def publish(build) -> str:
+    out = []
+    for cmd in (['rsync', '-rt', 'site/', PUBLISH_TO],
+                ['scp', 'tefilot.pdf', PUBLISH_TO + 'tefillot.pdf']):
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        out.append(result.stdout)
+        if result.returncode != 0:
+            raise StageError(''.join(out) + f"\n{cmd[0]} exited with {result.returncode}")
+    return ''.join(out)
+
+
+def build_catalog(build) -> str:
+    # in this process, so the catalog's own hash can be taken; nothing
+    # runs alongside it, as every other stage depends on it
+    from parse import parse_music, save_catalog
+    catalog = parse_music(tsv_path='x.tsv', workers=build.workers)
+    CATALOG_SNAPSHOT.parent.mkdir(parents=True, exist_ok=True)
+    save_catalog(catalog, CATALOG_SNAPSHOT)
+    build.products['catalog'] = hashlib.sha256(repr(asdict(catalog)).encode('utf-8')).hexdigest()
+    return ''
+
+
+STAGES = [
+    Stage('catalog', build_catalog,
+          inputs=('data/*.yaml', 'saves.json', 'incipits.txt', *PARSE_CODE),
+          outputs=('x.tsv', 'missing_incipits.txt', CATALOG_SNAPSHOT.as_posix())),
+    Stage('site', command('export.py'), deps=('catalog',),
+          inputs=('export.py', 'render.py', 'midi.py', *MUSIC_CODE, 'Templates/section.html',
+                  'Templates/site_index.html', 'static/*.js', 'static/*.css'),
+          outputs=('site/*', 'static/midi/*.mid')),
+    Stage('svg', command('engrave.py', parallel=True), deps=('catalog',),
+          inputs=('engrave.py', *MUSIC_CODE),
+          outputs=('Images/notation*.svg',)),
+    Stage('pdf', command('book.py', parallel=True), deps=('catalog', 'svg'),
+          inputs=('book.py', 'svg_rl.py'),
+          outputs=('tefilot.pdf',)),
+    Stage('publish', publish, deps=('site', 'pdf'), default=False),
+]
+
+
+class StageError(Exception):
+    pass
+
+
+class FileHashes:
+    ''' sha256 of files, recomputed only when their size or mtime changes '''
+
+    def __init__(self, known: dict):
+        self.known = known   # path -> [size, mtime_ns, digest]
+        self.lock = threading.Lock()
+
+    def digest(self, patterns: tuple[str, ...]) -> str:
+        ''' one hash over every file the patterns match, names included, so
+            adding or removing a file changes it too '''
+        h = hashlib.sha256()
+        for pattern in patterns:
+            paths = sorted(Path('.').glob(pattern)) if any(c in pattern for c in '*?[') else [Path(pattern)]
+            for path in paths:
+                h.update(f'{path.as_posix()}\0{self.file_digest(path)}\n'.encode('utf-8'))
+        return h.hexdigest()
+
+    def file_digest(self, path: Path) -> str:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return '-'
+        if not path.is_file():
+            return 'dir'
+        key = path.as_posix()
+        with self.lock:
+            known = self.known.get(key)
+        if known is not None and known[:2] == [st.st_size, st.st_mtime_ns]:
+            return known[2]
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        with self.lock:
+            self.known[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+
+class Build:
+    def __init__(self, workers: int = 1, force: bool = False, dry_run: bool = False):
+        self.workers = workers
+        self.force = force
+        self.dry_run = dry_run
+        self.stages = {stage.name: stage for stage in STAGES}
+        state = self.load_state()
+        self.files = FileHashes(state.get('files', {}))
+        self.last_runs: dict[str, dict] = state.get('stages', {})
+        self.products: dict[str, str] = {}
+        self.summary: list[tuple[str, str, float]] = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load_state() -> dict:
+        try:
+            state = json.loads(STATE_PATH.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        return state if state.get('version') == STATE_VERSION else {}
+
+    def save_state(self) -> None:
+        # (under the lock, so two stages finishing together can't write
+        # their snapshots in the wrong order)
+        with self.lock:
+            with self.files.lock:
+                state = {'version': STATE_VERSION, 'files': self.files.known, 'stages': self.last_runs}
+                text = json.dumps(state, indent=1, sort_keys=True)
+            STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(STATE_PATH, text)
+
+    def plan(self, targets: list[str]) -> list[Stage]:
+        ''' the targets and everything they depend on, dependencies first '''
+        names = targets or [stage.name for stage in STAGES if stage.default]
+        unknown = [name for name in names if name not in self.stages]
+        if unknown:
+            raise SystemExit(f"unknown stage(s) {', '.join(unknown)}; choose from {', '.join(self.stages)}")
+        wanted = set()
+
+        def visit(name):
+            if name not in wanted:
+                wanted.add(name)
+                for dep in self.stages[name].deps:
+                    visit(dep)
+        for name in names:
+            visit(name)
+        return [stage for stage in STAGES if stage.name in wanted]
+
+    def key(self, stage: Stage) -> str:
+        h = hashlib.sha256(stage.name.encode('utf-8'))
+        h.update(self.files.digest(stage.inputs).encode('utf-8'))
+        for dep in stage.deps:
+            h.update(f'{dep}={self.products[dep]}'.encode('utf-8'))
+        return h.hexdigest()
+
+    def run_stage(self, stage: Stage) -> str:
+        ''' 'built', 'skipped' or (with --dry-run) 'stale' '''
+        start = time.perf_counter()
+        key = self.key(stage)
+        last = self.last_runs.get(stage.name)
+        if not self.force and last is not None and last['key'] == key \
+                and last['outputs'] == self.files.digest(stage.outputs):
+            self.products[stage.name] = last['product']
+            status = 'skipped'
+        elif self.dry_run:
+            # what it would produce isn't known, so everything after it is stale too
+            self.products[stage.name] = 'stale'
+            status = 'stale'
+        else:
+            try:
+                output = stage.run(self)
+            except Exception:
+                with self.lock:
+                    self.summary.append((stage.name, 'failed', time.perf_counter() - start))
+                raise
+            if output.strip():
+                print(f"== {stage.name}\n{output.rstrip()}", flush=True)
+            outputs = self.files.digest(stage.outputs)
+            self.products.setdefault(stage.name, outputs)
+            with self.lock:
+                self.last_runs[stage.name] = {'key': key, 'outputs': outputs,
+                                              'product': self.products[stage.name]}
+            self.save_state()
+            status = 'built'
+        with self.lock:
+            self.summary.append((stage.name, status, time.perf_counter() - start))
+        return status
+
+    def run(self, targets: list[str]) -> bool:
+        ''' True if every stage succeeded (or was skipped) '''
+        pending = self.plan(targets)
+        done, failed = set(), set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=len(pending) or 1) as pool:
+            while pending or running:
+                for stage in list(pending):
+                    if any(dep in failed for dep in stage.deps):
+                        pending.remove(stage)
+                        failed.add(stage.name)
+                        self.summary.append((stage.name, 'not run', 0.0))
+                    elif all(dep in done for dep in stage.deps):
+                        pending.remove(stage)
+                        running[pool.submit(self.run_stage, stage)] = stage
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(stage.name)
+                    except Exception as e:
+                        print(f"== {stage.name} failed\n{e}", flush=True)
+                        failed.add(stage.name)
+        return not failed
+
+    def print_summary(self, seconds: float) -> None:
+        for name, status, stage_seconds in self.summary:
+            print(f"  {name:<10} {status:<8} {stage_seconds:8.3f} s")
+        print(f"  {'total':<10} {'':<8} {seconds:8.3f} s")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Build whatever is out of date")
+    parser.add_argument('targets', nargs='*', metavar='STAGE',
+                        help=f"any of {', '.join(stage.name for stage in STAGES)} (default: all but publish)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes for parsing, engraving and laying out the book")
+    parser.add_argument('--force', action='store_true', help="run every stage, changed or not")
+    parser.add_argument('--dry-run', '-n', action='store_true', help="only show what is out of date")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build = Build(args.workers, args.force, args.dry_run)
+    ok = build.run(args.targets)
+    build.print_summary(time.perf_counter() - start)
+    sys.exit(0 if ok else 1)
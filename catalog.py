@@ -0,0 +1,112 @@
+''' the parsed, ordered catalog: sections -> incipits -> versions
+
+    parse.parse_music builds one of these; render.py and svg_rl.py both
+    consume it directly, and x.tsv is just one optional way of writing it out.
+    parse.stream_catalog hands over the same thing a group at a time, in
+    the shape of Catalog.groups(), for collections too big to hold.
+'''
+
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from atomic import atomic_open
+
+
+@dataclass
+class Source:
+    book: str
+    page: str
+
+    def html(self) -> str:
+        return f"<i>{self.book}</i>:{self.page}"
+
+
+@dataclass
+class Version:
+    ''' One printed setting of an incipit, with the other books it is
+        cross-referenced in (via PK/FK) already folded into `sources`. '''
+    number: int
+    composer: str
+    abc: str
+    sources: list[Source]
+    nb: str = ''
+    # notes, lyrics, key, time, ... as read by parse.MusicState
+    music_fields: dict = field(default_factory=dict)
+
+    def source_lines(self) -> list[str]:
+        lines = [s.html() for s in self.sources]
+        if self.nb:
+            lines.append(self.nb)
+        return lines
+
+    def source_html(self) -> str:
+        s = '<br/>'.join(s.html() for s in self.sources)
+        if self.nb:
+            s += f"<br>{self.nb}"
+        return s
+
+
+@dataclass
+class Incipit:
+    title: str
+    versions: list[Version] = field(default_factory=list)
+
+
+@dataclass
+class Section:
+    title: str | None  # None for incipits that precede the first heading
+    incipits: list[Incipit] = field(default_factory=list)
+
+    def entries(self) -> Iterator[tuple]:
+        if self.title is not None:
+            yield ('section', self.title)
+        for incipit in self.incipits:
+            yield ('incipit', incipit.title)
+            for version in incipit.versions:
+                yield ('notation', version)
+
+    def versions(self) -> Iterator[Version]:
+        for incipit in self.incipits:
+            yield from incipit.versions
+
+
+@dataclass
+class Catalog:
+    sections: list[Section] = field(default_factory=list)
+
+    def entries(self) -> Iterator[tuple]:
+        ''' flat walk in page order:
+            ('section', title), ('incipit', title), ('notation', version) '''
+        for section in self.sections:
+            yield from section.entries()
+
+    def versions(self) -> Iterator[Version]:
+        for section in self.sections:
+            yield from section.versions()
+
+    def groups(self) -> Iterator[tuple]:
+        ''' ('section', title) and ('incipit', Incipit), in page order '''
+        for section in self.sections:
+            if section.title is not None:
+                yield ('section', section.title)
+            for incipit in section.incipits:
+                yield ('incipit', incipit)
+
+    def write_tsv(self, tsv_path) -> None:
+        write_tsv(tsv_path, self.groups())
+
+
+def write_tsv(tsv_path, groups) -> None:
+    ''' `groups` as from Catalog.groups(), written as they come '''
+    with atomic_open(tsv_path) as o:
+        print('Incipit\tComposer\tMusic\tSource', file=o)
+        for kind, item in groups:
+            if kind == 'section':
+                print(item, file=o)
+                continue
+            for version in item.versions:
+                print(item.title,
+                      version.composer,
+                      version.abc,
+                      version.source_html(),
+                      sep='\t', file=o)
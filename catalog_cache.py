@@ -0,0 +1,160 @@
+''' persistent per-file cache of parsed pieces, so that a rebuild only
+    re-parses the YAML files (and the saves.json lines) that changed
+'''
+
+from collections import defaultdict
+from dataclasses import asdict
+import hashlib
+from pathlib import Path
+import pickle
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_PATH = Path('.cache/catalog.pickle')
+
+
+def file_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class CatalogCache:
+    ''' Entries are keyed by source path.  Each one remembers the size,
+        mtime and content hash of the file it was built from, plus the
+        parsed pieces as (title, fields) pairs in file order.
+
+        The cache is thrown away wholesale if `code_hash` changes,
+        i.e. if the parsing code itself was edited.
+    '''
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, code_hash: str = ''):
+        self.path = Path(path)
+        self.code_hash = code_hash
+        self.entries: dict[str, dict] = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with self.path.open('rb') as f:
+                stored = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        if stored.get('version') != CACHE_VERSION or stored.get('code_hash') != self.code_hash:
+            return
+        self.entries = stored['entries']
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with tmp_path.open('wb') as f:
+            pickle.dump({'version': CACHE_VERSION,
+                         'code_hash': self.code_hash,
+                         'entries': self.entries}, f)
+        tmp_path.replace(self.path)
+        self.dirty = False
+
+    def lookup(self, source_path: Path, piece_type) -> tuple[dict[str, list] | None, tuple]:
+        ''' Return ({title: [pieces]}, stamp) if `source_path` is unchanged
+            since it was cached, else (None, stamp); hand the stamp back to
+            store() once the file has been parsed.
+        '''
+        key = str(source_path)
+        st = source_path.stat()
+        entry = self.entries.get(key)
+        if entry is not None and (entry['size'], entry['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+            self.hits += 1
+            return self._rebuild(entry['pieces'], piece_type), ()
+
+        digest = file_hash(source_path.read_bytes())
+        if entry is not None and entry['hash'] == digest:
+            # touched but not edited
+            entry['size'], entry['mtime_ns'] = st.st_size, st.st_mtime_ns
+            self.dirty = True
+            self.hits += 1
+            return self._rebuild(entry['pieces'], piece_type), ()
+
+        self.misses += 1
+        return None, (st.st_size, st.st_mtime_ns, digest)
+
+    def store(self, source_path: Path, stamp: tuple, parsed: dict[str, list]) -> None:
+        size, mtime_ns, digest = stamp
+        self.entries[str(source_path)] = {
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'hash': digest,
+            'pieces': self._flatten(parsed),
+        }
+        self.dirty = True
+
+    def pieces_for_file(self, source_path: Path, parse_fn, piece_type) -> dict[str, list]:
+        ''' Return {title: [pieces]} for one YAML file, calling
+            parse_fn(source_path, result_dict) only if the file changed.
+        '''
+        parsed, stamp = self.lookup(source_path, piece_type)
+        if parsed is None:
+            parsed = defaultdict(list)
+            parse_fn(source_path, parsed)
+            self.store(source_path, stamp, parsed)
+        return parsed
+
+    def pieces_for_log(self, log_path: Path, parse_line_fn, piece_type) -> dict[str, list]:
+        ''' Like pieces_for_file, but for an append-only JSON-lines log:
+            if the file has only grown, just the new lines are replayed.
+        '''
+        key = str(log_path)
+        try:
+            st = log_path.stat()
+        except FileNotFoundError:
+            return {}
+        entry = self.entries.get(key)
+        if entry is not None and (entry['size'], entry['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+            self.hits += 1
+            return self._rebuild(entry['pieces'], piece_type)
+
+        data = log_path.read_bytes()
+        offset = 0
+        pieces = []
+        if entry is not None and len(data) >= entry['offset'] \
+                and file_hash(data[:entry['offset']]) == entry['prefix_hash']:
+            offset = entry['offset']
+            pieces = list(entry['pieces'])
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        # only replay complete lines; a partial last line waits for the next build
+        end = data.rfind(b'\n') + 1
+        new_parsed: dict[str, list] = defaultdict(list)
+        if end > offset:
+            for line in data[offset:end].decode('utf-8').splitlines():
+                if line.strip():
+                    parse_line_fn(line, new_parsed)
+            pieces.extend(self._flatten(new_parsed))
+            offset = end
+
+        self.entries[key] = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'offset': offset,
+            'prefix_hash': file_hash(data[:offset]),
+            'pieces': pieces,
+        }
+        self.dirty = True
+        return self._rebuild(pieces, piece_type)
+
+    @staticmethod
+    def _flatten(parsed: dict[str, list]) -> list[tuple[str, dict]]:
+        return [(title, asdict(piece))
+                for title, pieces in parsed.items()
+                for piece in pieces]
+
+    @staticmethod
+    def _rebuild(flat: list[tuple[str, dict]], piece_type) -> dict[str, list]:
+        parsed: dict[str, list] = {}
+        for title, fields in flat:
+            parsed.setdefault(title, []).append(piece_type(**fields))
+        return parsed
+
@@ -1,3 +1,2 @@
 #!/bin/sh
-scp index.html ghweb:tefillot/index.html
-scp tefilot.pdf ghweb:tefillot/tefillot.pdf
+python build.py publish --workers 4
@@ -0,0 +1,164 @@
+''' propose PK/FK links between versions of the same tune in different books
+
+    Each parsed piece is fingerprinted by the same transposition-invariant
+    interval and note-length-ratio n-grams search.py indexes.  MinHash
+    signatures, split into LSH bands, bring pieces that share most of
+    their n-grams into the same bucket, so only those candidate pairs are
+    compared, never every pair.  Pairs whose n-gram sets overlap enough
+    (Jaccard similarity) are joined into clusters.
+
+    The report (duplicates.txt) lists, for each cluster, the PK to put on
+    one version and the FK to put on the others, reusing a PK that is
+    already there.  Clusters that are already linked are left out.
+'''
+
+from dataclasses import dataclass
+import random
+import re
+import zlib
+
+from atomic import atomic_open
+from parse import ParsedPiece, load_parsed_music
+from search import FeatureCache, feature_salt, ngrams
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+THRESHOLD = 0.5  # Jaccard similarity of the n-gram sets
+MIN_NGRAMS = 6   # too short to say anything
+MERSENNE = (1 << 61) - 1
+
+_rng = random.Random(0)
+HASH_COEFFS = [(_rng.randrange(1, MERSENNE), _rng.randrange(MERSENNE)) for _ in range(NUM_HASHES)]
+
+
+@dataclass
+class Candidate:
+    title: str
+    piece: ParsedPiece
+    grams: frozenset
+
+
+def minhash(grams) -> tuple[int, ...]:
+    hashes = [zlib.crc32(g.encode('utf-8')) for g in grams]
+    return tuple(min((a * h + b) % MERSENNE for h in hashes) for a, b in HASH_COEFFS)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b)
+
+
+def candidates(parsed_music: dict[str, list[ParsedPiece]]) -> list[Candidate]:
+    features = FeatureCache(salt=feature_salt())
+    found = []
+    for title, pieces in parsed_music.items():
+        for piece in pieces:
+            if not piece.music_fields:
+                continue
+            grams = frozenset(ngrams(*features.features_for(piece.music_fields)))
+            if len(grams) >= MIN_NGRAMS:
+                found.append(Candidate(title, piece, grams))
+    features.save()
+    return found
+
+
+def similar_pairs(found: list[Candidate]) -> dict[tuple[int, int], float]:
+    buckets: dict[tuple, list[int]] = {}
+    for i, candidate in enumerate(found):
+        signature = minhash(candidate.grams)
+        for band in range(BANDS):
+            key = (band,) + signature[band * ROWS:(band + 1) * ROWS]
+            buckets.setdefault(key, []).append(i)
+
+    pairs = {}
+    for members in buckets.values():
+        for x, i in enumerate(members):
+            for j in members[x + 1:]:
+                if (i, j) in pairs:
+                    continue
+                a, b = found[i].piece, found[j].piece
+                if (a.book, a.page) == (b.book, b.page):
+                    continue
+                score = jaccard(found[i].grams, found[j].grams)
+                if score >= THRESHOLD:
+                    pairs[(i, j)] = score
+    return pairs
+
+
+def clusters(count: int, pairs: dict[tuple[int, int], float]) -> list[tuple[list[int], float]]:
+    ''' connected components, with the weakest link that holds each together '''
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        parent[find(i)] = find(j)
+    groups: dict[int, list[int]] = {}
+    for i in range(count):
+        groups.setdefault(find(i), []).append(i)
+    weakest: dict[int, float] = {}
+    for (i, _j), score in pairs.items():
+        root = find(i)
+        weakest[root] = min(score, weakest.get(root, 1.0))
+    return [(members, weakest[root]) for root, members in groups.items() if len(members) > 1]
+
+
+def suggest_pk(candidate: Candidate) -> str:
+    ''' in the style of the existing keys, e.g. goldfarb_vaychulu '''
+    composer = candidate.piece.composer
+    # "Carlebach, Shlomo" or "Shlomo Carlebach"
+    surname = composer.split(',')[0] if ',' in composer else (composer.split() or [''])[-1]
+    surname = re.sub(r'[^a-z]', '', surname.lower()) or 'unknown'
+    return f"{surname}_{re.sub(r'[^a-z]', '', candidate.title.lower())}"
+
+
+def link(members: list[Candidate]) -> tuple[str, list[tuple[Candidate, str]]]:
+    ''' (pk, [(candidate, what to set on it)]); empty if already linked '''
+    with_pk = [c for c in members if c.piece.pk is not None]
+    primary = with_pk[0] if with_pk else members[0]
+    pk = primary.piece.pk or suggest_pk(primary)
+    changes = []
+    for c in members:
+        if c is primary:
+            if c.piece.pk is None:
+                changes.append((c, f"PK: {pk}"))
+        elif c.piece.fk != pk:
+            note = f" (replacing PK: {c.piece.pk})" if c.piece.pk is not None else ''
+            changes.append((c, f"FK: {pk}{note}"))
+    return pk, changes
+
+
+def describe(c: Candidate) -> str:
+    return f"{c.piece.book} p.{c.piece.page}: {c.title} ({c.piece.composer})"
+
+
+def find_duplicates(parsed_music: dict[str, list[ParsedPiece]], report_path='duplicates.txt') -> dict[str, int]:
+    found = candidates(parsed_music)
+    pairs = similar_pairs(found)
+    groups = sorted(clusters(len(found), pairs), key=lambda g: (-g[1], min(g[0])))
+    counts = {'pieces': len(found), 'pairs': len(pairs), 'clusters': len(groups), 'to_link': 0}
+    with atomic_open(report_path) as o:
+        for indexes, score in groups:
+            members = [found[i] for i in sorted(indexes)]
+            pk, changes = link(members)
+            if not changes:
+                continue
+            counts['to_link'] += 1
+            print(f"# similarity {score:.2f}", file=o)
+            for c in members:
+                change = next((what for other, what in changes if other is c), 'ok')
+                print(f"{describe(c)}\n    {change}", file=o)
+            print(file=o)
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Write duplicates.txt: likely duplicate melodies and the PK/FK fields that would link them")
+    parser.add_argument('--out', default='duplicates.txt')
+    args = parser.parse_args()
+    print(find_duplicates(load_parsed_music(), args.out))
@@ -0,0 +1,506 @@
+''' engrave incipits straight to SVG, without a browser
+
+    Takes the Note list that MusicState builds and lays out a treble staff
+    with key and time signatures, beams, flags, accidentals, dots, triplets,
+    slurs, ledger lines and lyrics.  The output is deterministic (fixed
+    precision, no timestamps or ids) so it can be cached and diffed.
+
+    Everything is drawn as filled <path>s (plus <text> for digits and
+    lyrics) so that svg_rl.recursivelyRed can recolour it.
+
+    python engrave.py [--workers N]   writes Images/notation{N}.svg
+'''
+
+from dataclasses import dataclass, field
+import math
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from atomic import atomic_write_text
+from parse import MusicState
+from theory import (FLAT_ORDER, SHARP_ORDER, accidental_offset, diatonic_step,
+                    duration_fraction, key_signature)
+
+S = 8.0                     # distance between staff lines
+TOP_LINE = 38               # diatonic step of the top line (F5)
+MIDDLE_LINE = 34            # B4; notes below it get stems up
+BOTTOM_LINE = 30            # E4
+STEM = 3.5 * S
+SYSTEM_HEIGHT = 15 * S
+STAFF_OFFSET = 4.5 * S      # from the top of a system to its top line
+LEFT_MARGIN = 4.0
+LYRIC_SIZE = 11
+LYRIC_CHAR = 5.6            # rough advance per lyric character
+
+# where each accidental in a key signature sits on a treble staff
+SHARP_STEPS = {'f': 38, 'c': 35, 'g': 39, 'd': 36, 'a': 33, 'e': 37, 'b': 34}
+FLAT_STEPS = {'b': 34, 'e': 37, 'a': 33, 'd': 36, 'g': 32, 'c': 35, 'f': 31}
+
+
+def fmt(v: float) -> str:
+    s = f'{v:.2f}'.rstrip('0').rstrip('.')
+    return '0' if s == '-0' else s
+
+
+def path_d(commands: list) -> str:
+    ''' [('M', x, y), ('C', x1, y1, x2, y2, x, y), ('Z',)] -> "M..." '''
+    return ' '.join(c[0] + ' '.join(fmt(v) for v in c[1:]) for c in commands)
+
+
+def box(x: float, y: float, w: float, h: float) -> list:
+    return [('M', x, y), ('L', x + w, y), ('L', x + w, y + h), ('L', x, y + h), ('Z',)]
+
+
+def ellipse(cx: float, cy: float, rx: float, ry: float, angle: float = 0.0, reverse=False) -> list:
+    ''' a closed ellipse as four cubic beziers, optionally rotated (degrees) '''
+    k = 0.5523
+    a = math.radians(angle)
+    cos_a, sin_a = math.cos(a), math.sin(a)
+
+    def pt(x, y):
+        return (cx + x * cos_a - y * sin_a, cy + x * sin_a + y * cos_a)
+
+    quads = [((rx, 0), (rx, k * ry), (k * rx, ry), (0, ry)),
+             ((0, ry), (-k * rx, ry), (-rx, k * ry), (-rx, 0)),
+             ((-rx, 0), (-rx, -k * ry), (-k * rx, -ry), (0, -ry)),
+             ((0, -ry), (k * rx, -ry), (rx, -k * ry), (rx, 0))]
+    if reverse:
+        quads = [(q[3], q[2], q[1], q[0]) for q in reversed(quads)]
+    cmds = [('M', *pt(*quads[0][0]))]
+    for _start, c1, c2, end in quads:
+        cmds.append(('C', *pt(*c1), *pt(*c2), *pt(*end)))
+    cmds.append(('Z',))
+    return cmds
+
+
+def slanted(x1: float, y1: float, x2: float, y2: float, thickness: float) -> list:
+    ''' a parallelogram of the given vertical thickness (beams, sharp bars) '''
+    return [('M', x1, y1), ('L', x2, y2), ('L', x2, y2 + thickness),
+            ('L', x1, y1 + thickness), ('Z',)]
+
+
+@dataclass
+class Placed:
+    ''' one note or rest, positioned '''
+    note: object
+    x: float
+    step: int
+    value: object           # Fraction of a whole note
+    base: int               # 1, 2, 4, 8, 16 ...
+    dots: int
+    rest: bool
+    accidental: int | None  # what to print in front of the note, if anything
+    stem_up: bool = True
+    stem_tip: float = 0.0
+    beamed: bool = False
+
+
+@dataclass
+class SvgBuilder:
+    paths: list = field(default_factory=list)
+    texts: list = field(default_factory=list)
+
+    def fill(self, commands: list, evenodd: bool = False) -> None:
+        rule = ' fill-rule="evenodd"' if evenodd else ''
+        self.paths.append(f'<path d="{path_d(commands)}" fill="#000000"{rule}/>')
+
+    def stroke(self, commands: list, width: float) -> None:
+        self.paths.append(f'<path d="{path_d(commands)}" fill="none" stroke="#000000" stroke-width="{fmt(width)}"/>')
+
+    def text(self, x: float, y: float, s: str, size: float, anchor='middle', bold=False,
+             family='Times-Roman') -> None:
+        weight = ' font-weight="bold"' if bold else ''
+        self.texts.append(f'<text x="{fmt(x)}" y="{fmt(y)}" font-family="{family}" font-size="{fmt(size)}"'
+                          f' text-anchor="{anchor}"{weight} fill="#000000">{escape(s)}</text>')
+
+
+class Engraver:
+    def __init__(self, piece: dict, music: list):
+        self.piece = piece
+        self.music = music
+        self.out = SvgBuilder()
+
+    # -- geometry -----------------------------------------------------------
+
+    def y(self, staff_top: float, step: int) -> float:
+        return staff_top + (TOP_LINE - step) * S / 2
+
+    # -- layout -------------------------------------------------------------
+
+    def systems(self) -> list[list]:
+        ''' split the notes into lines at the bars listed in break_bars '''
+        breaks = set(self.piece.get('break_bars') or [])
+        systems = [[]]
+        bar_number = 0
+        for note in self.music:
+            systems[-1].append(note)
+            if note.trailing_bar:
+                bar_number += 1
+                if bar_number in breaks:
+                    systems.append([])
+        return [s for s in systems if s]
+
+    def place(self, notes: list, x: float) -> tuple[list[Placed], list[float], float]:
+        placed = []
+        bars = []
+        accidentals = {}
+        for note in notes:
+            rest = note.note_name[0] == 'r'
+            value = duration_fraction(note.duration)
+            base = int(note.duration.rstrip('.'))
+            dots = len(note.duration) - len(note.duration.rstrip('.'))
+            step = MIDDLE_LINE if rest else diatonic_step(note.octave, note.note_name[0])
+
+            # same rule as MusicState.abc_notes: print an accidental unless
+            # this bar already has it
+            shown = None
+            if not rest:
+                offset = accidental_offset(note.note_name)
+                letter = note.note_name[0]
+                if offset is not None and (offset == 0 or accidentals.get(letter) != offset):
+                    shown = offset
+                    accidentals[letter] = offset
+
+            if shown is not None:
+                x += 1.2 * S
+            lyric = note.lyric.rstrip('-') if note.lyric != '_' else ''
+            width = max(2.2 * S + 3.2 * S * math.sqrt(float(value) * 4),
+                        len(lyric) * LYRIC_CHAR + 0.8 * S)
+            placed.append(Placed(note, x + S, step, value, base, dots, rest, shown))
+            x += width
+            if note.trailing_bar:
+                bars.append(x)
+                x += 1.2 * S
+                accidentals = {}
+        return placed, bars, x
+
+    # -- drawing ------------------------------------------------------------
+
+    def staff(self, staff_top: float, width: float) -> None:
+        for i in range(5):
+            self.out.fill(box(LEFT_MARGIN, staff_top + i * S - 0.4, width - LEFT_MARGIN, 0.8))
+
+    def clef(self, staff_top: float) -> float:
+        x = LEFT_MARGIN + 1.4 * S
+        g = self.y(staff_top, 32)  # the G line the clef curls around
+        self.out.stroke([
+            ('M', x + 0.5 * S, staff_top + 5.0 * S),
+            ('C', x - 0.3 * S, staff_top + 5.6 * S, x - 0.6 * S, staff_top + 4.2 * S, x + 0.3 * S, staff_top + 4.3 * S),
+            ('L', x + 0.9 * S, staff_top - 1.5 * S),
+            ('C', x + 1.3 * S, staff_top - 0.4 * S, x - 1.2 * S, staff_top + 0.8 * S, x - 1.0 * S, g),
+            ('C', x - 0.8 * S, g + 1.6 * S, x + 1.6 * S, g + 1.6 * S, x + 1.5 * S, g),
+            ('C', x + 1.4 * S, g - 1.0 * S, x, g - 1.0 * S, x, g),
+        ], 1.6)
+        return LEFT_MARGIN + 3.4 * S
+
+    def accidental(self, x: float, y: float, offset: int) -> None:
+        if offset > 0:
+            self.out.fill(box(x - 0.35 * S, y - 1.3 * S, 0.16 * S, 2.6 * S))
+            self.out.fill(box(x + 0.2 * S, y - 1.4 * S, 0.16 * S, 2.6 * S))
+            self.out.fill(slanted(x - 0.6 * S, y - 0.35 * S, x + 0.6 * S, y - 0.65 * S, 0.25 * S))
+            self.out.fill(slanted(x - 0.6 * S, y + 0.45 * S, x + 0.6 * S, y + 0.15 * S, 0.25 * S))
+        elif offset < 0:
+            self.out.fill(box(x - 0.4 * S, y - 1.8 * S, 0.15 * S, 2.3 * S))
+            self.out.fill(ellipse(x, y, 0.45 * S, 0.32 * S, -30) +
+                          ellipse(x - 0.05 * S, y + 0.05 * S, 0.28 * S, 0.17 * S, -30, reverse=True),
+                          evenodd=True)
+        else:
+            self.out.fill(box(x - 0.35 * S, y - 1.4 * S, 0.15 * S, 2.2 * S))
+            self.out.fill(box(x + 0.2 * S, y - 0.8 * S, 0.15 * S, 2.2 * S))
+            self.out.fill(slanted(x - 0.35 * S, y - 0.4 * S, x + 0.35 * S, y - 0.55 * S, 0.22 * S))
+            self.out.fill(slanted(x - 0.35 * S, y + 0.4 * S, x + 0.35 * S, y + 0.25 * S, 0.22 * S))
+
+    def key_signature(self, staff_top: float, x: float) -> float:
+        count = key_signature(self.piece.get('key'))
+        if count > 0:
+            letters, steps, offset = SHARP_ORDER[:count], SHARP_STEPS, 1
+        else:
+            letters, steps, offset = FLAT_ORDER[:-count], FLAT_STEPS, -1
+        for letter in letters:
+            self.accidental(x + 0.6 * S, self.y(staff_top, steps[letter]), offset)
+            x += 1.1 * S
+        return x + 0.6 * S
+
+    def time_signature(self, staff_top: float, x: float) -> float:
+        time = str(self.piece.get('time') or '')
+        if '/' not in time:
+            return x
+        top, bottom = time.split('/', 1)
+        self.out.text(x + S, staff_top + 1.9 * S, top, 2.6 * S, bold=True)
+        self.out.text(x + S, staff_top + 3.9 * S, bottom, 2.6 * S, bold=True)
+        return x + 2.6 * S
+
+    def ledger_lines(self, staff_top: float, p: Placed) -> None:
+        steps = []
+        if p.step <= BOTTOM_LINE - 2:
+            steps = range(BOTTOM_LINE - 2, p.step - 1, -2)
+        elif p.step >= TOP_LINE + 2:
+            steps = range(TOP_LINE + 2, p.step + 1, 2)
+        for step in steps:
+            self.out.fill(box(p.x - 1.0 * S, self.y(staff_top, step) - 0.4, 2.0 * S, 0.8))
+
+    def notehead(self, staff_top: float, p: Placed) -> None:
+        y = self.y(staff_top, p.step)
+        if p.base <= 2:
+            rx = 0.78 * S if p.base == 1 else 0.62 * S
+            outer = ellipse(p.x, y, rx, 0.45 * S, -20 if p.base == 2 else 0)
+            inner = ellipse(p.x, y, rx * 0.6, 0.22 * S, -35 if p.base == 2 else 40, reverse=True)
+            self.out.fill(outer + inner, evenodd=True)
+        else:
+            self.out.fill(ellipse(p.x, y, 0.62 * S, 0.45 * S, -20))
+        if p.accidental is not None:
+            self.accidental(p.x - 1.6 * S, y, p.accidental)
+        for i in range(p.dots):
+            dot_y = y - S / 2 if p.step % 2 == 0 else y
+            self.out.fill(ellipse(p.x + 1.1 * S + i * 0.6 * S, dot_y, 0.18 * S, 0.18 * S))
+
+    def rest(self, staff_top: float, p: Placed) -> None:
+        mid = self.y(staff_top, MIDDLE_LINE)
+        x = p.x
+        if p.base == 1:
+            self.out.fill(box(x - 0.6 * S, mid - S, 1.2 * S, 0.5 * S))
+        elif p.base == 2:
+            self.out.fill(box(x - 0.6 * S, mid - 0.5 * S, 1.2 * S, 0.5 * S))
+        elif p.base == 4:
+            self.out.fill([('M', x - 0.2 * S, mid - 1.6 * S), ('L', x + 0.5 * S, mid - 0.7 * S),
+                           ('L', x - 0.1 * S, mid), ('L', x + 0.5 * S, mid + 0.8 * S),
+                           ('C', x - 0.3 * S, mid + 0.5 * S, x - 0.4 * S, mid + 1.2 * S, x, mid + 1.5 * S),
+                           ('C', x - 0.8 * S, mid + 1.2 * S, x - 0.8 * S, mid + 0.3 * S, x - 0.1 * S, mid + 0.5 * S),
+                           ('L', x - 0.6 * S, mid - 0.2 * S), ('L', x, mid - 0.8 * S), ('Z',)])
+        else:
+            hooks = max(1, int(math.log2(p.base)) - 2)
+            self.out.fill(slanted(x + 0.5 * S, mid - 0.9 * S, x - 0.2 * S, mid + (hooks + 0.6) * S, 0.2 * S))
+            for i in range(hooks):
+                self.out.fill(ellipse(x - 0.4 * S, mid - 0.6 * S + i * S, 0.25 * S, 0.25 * S))
+        for i in range(p.dots):
+            self.out.fill(ellipse(x + 1.0 * S + i * 0.6 * S, mid - 0.5 * S, 0.18 * S, 0.18 * S))
+
+    def stem_x(self, p: Placed) -> float:
+        return p.x + 0.55 * S if p.stem_up else p.x - 0.55 * S
+
+    def stems_and_beams(self, staff_top: float, placed: list[Placed]) -> None:
+        # group consecutive eighths and shorter, broken at rests, bars and backticks
+        groups = []
+        current = []
+        for p in placed:
+            beamable = not p.rest and p.base >= 8
+            if beamable:
+                current.append(p)
+            elif current:
+                groups.append(current)
+                current = []
+            if p.note.trailing_space or p.note.trailing_bar:
+                if current:
+                    groups.append(current)
+                current = []
+        if current:
+            groups.append(current)
+
+        for group in groups:
+            if len(group) < 2:
+                continue
+            up = sum(p.step for p in group) / len(group) < MIDDLE_LINE
+            if up:
+                tip = min(self.y(staff_top, p.step) for p in group) - STEM
+            else:
+                tip = max(self.y(staff_top, p.step) for p in group) + STEM
+            for p in group:
+                p.stem_up, p.stem_tip, p.beamed = up, tip, True
+            x1, x2 = self.stem_x(group[0]), self.stem_x(group[-1])
+            thickness = 0.5 * S
+            beam_y = tip if up else tip - thickness
+            self.out.fill(slanted(x1 - 0.1, beam_y, x2 + 0.1, beam_y, thickness))
+
+            # secondary beams for sixteenths (and tertiary for 32nds)
+            for level in (2, 3):
+                min_base = 4 * 2 ** level
+                offset = (level - 1) * 0.8 * S
+                level_y = beam_y + offset if up else beam_y - offset
+                i = 0
+                while i < len(group):
+                    if group[i].base < min_base:
+                        i += 1
+                        continue
+                    j = i
+                    while j + 1 < len(group) and group[j + 1].base >= min_base:
+                        j += 1
+                    if j > i:
+                        xa, xb = self.stem_x(group[i]), self.stem_x(group[j])
+                    elif i + 1 < len(group):
+                        xa, xb = self.stem_x(group[i]), self.stem_x(group[i]) + 1.0 * S
+                    else:
+                        xa, xb = self.stem_x(group[i]) - 1.0 * S, self.stem_x(group[i])
+                    self.out.fill(slanted(xa, level_y, xb, level_y, thickness))
+                    i = j + 1
+
+        for p in placed:
+            if p.rest or p.base <= 1:
+                continue
+            y = self.y(staff_top, p.step)
+            if not p.beamed:
+                p.stem_up = p.step < MIDDLE_LINE
+                p.stem_tip = y - STEM if p.stem_up else y + STEM
+            x = self.stem_x(p)
+            top, bottom = (p.stem_tip, y - 0.1 * S) if p.stem_up else (y + 0.1 * S, p.stem_tip)
+            self.out.fill(box(x - 0.5, top, 1.0, bottom - top))
+            if not p.beamed and p.base >= 8:
+                flags = int(math.log2(p.base)) - 2
+                for i in range(flags):
+                    if p.stem_up:
+                        fy = p.stem_tip + i * 0.8 * S
+                        self.out.fill([('M', x, fy), ('C', x + 0.2 * S, fy + 1.2 * S, x + 1.6 * S, fy + 1.4 * S, x + 1.0 * S, fy + 3.0 * S),
+                                       ('C', x + 1.2 * S, fy + 1.9 * S, x + 0.4 * S, fy + 1.6 * S, x, fy + 1.2 * S), ('Z',)])
+                    else:
+                        fy = p.stem_tip - i * 0.8 * S
+                        self.out.fill([('M', x, fy), ('C', x + 0.2 * S, fy - 1.2 * S, x + 1.6 * S, fy - 1.4 * S, x + 1.0 * S, fy - 3.0 * S),
+                                       ('C', x + 1.2 * S, fy - 1.9 * S, x + 0.4 * S, fy - 1.6 * S, x, fy - 1.2 * S), ('Z',)])
+
+    def triplets(self, staff_top: float, placed: list[Placed]) -> None:
+        i = 0
+        while i < len(placed):
+            prefix = placed[i].note.triplet_prefix
+            if not prefix:
+                i += 1
+                continue
+            group = placed[i:i + int(prefix)]
+            top = min(min(self.y(staff_top, p.step), p.stem_tip if not p.rest and p.base > 1 else 1e9)
+                      for p in group)
+            top = min(top, staff_top) - 1.2 * S
+            x1, x2 = group[0].x - 0.6 * S, group[-1].x + 0.6 * S
+            mid = (x1 + x2) / 2
+            if not all(p.beamed for p in group):
+                self.out.fill(box(x1, top, mid - x1 - 0.8 * S, 0.8))
+                self.out.fill(box(mid + 0.8 * S, top, x2 - mid - 0.8 * S, 0.8))
+                self.out.fill(box(x1, top, 0.8, 0.7 * S))
+                self.out.fill(box(x2 - 0.8, top, 0.8, 0.7 * S))
+            self.out.text(mid, top + 0.45 * S, prefix, 1.5 * S, bold=True)
+            i += len(group)
+
+    def slurs(self, staff_top: float, placed: list[Placed]) -> None:
+        start = None
+        for p in placed:
+            if p.note.open_paren and start is None:
+                start = p
+            if p.note.close_paren and start is not None and p is not start:
+                below = start.stem_up
+                y1 = self.y(staff_top, start.step) + (0.8 * S if below else -0.8 * S)
+                y2 = self.y(staff_top, p.step) + (0.8 * S if below else -0.8 * S)
+                x1, x2 = start.x, p.x
+                bulge = min(1.6 * S, 0.5 * S + (x2 - x1) * 0.08)
+                h = bulge if below else -bulge
+                thick = 0.35 * S if below else -0.35 * S
+                dx = (x2 - x1) / 3
+                self.out.fill([('M', x1, y1),
+                               ('C', x1 + dx, y1 + h, x2 - dx, y2 + h, x2, y2),
+                               ('C', x2 - dx, y2 + h - thick, x1 + dx, y1 + h - thick, x1, y1),
+                               ('Z',)])
+                start = None
+
+    def lyrics(self, staff_top: float, placed: list[Placed]) -> None:
+        baseline = staff_top + 8 * S
+        for i, p in enumerate(placed):
+            lyric = p.note.lyric
+            if not lyric:
+                continue
+            nxt = placed[i + 1].x if i + 1 < len(placed) else p.x + 3 * S
+            if lyric == '_':
+                self.out.fill(box(p.x - 1.2 * S, baseline, nxt - p.x, 0.6))
+                continue
+            text = lyric.rstrip('-')
+            if text:
+                self.out.text(p.x, baseline, text, LYRIC_SIZE, family='Helvetica')
+            if lyric.endswith('-'):
+                gap_x = (p.x + len(text) * LYRIC_CHAR / 2 + nxt - 3) / 2
+                self.out.text(gap_x, baseline, '-', LYRIC_SIZE, family='Helvetica')
+
+    def bar_lines(self, staff_top: float, bars: list[float]) -> None:
+        for x in bars:
+            self.out.fill(box(x, staff_top, 1.0, 4 * S))
+
+    def svg(self) -> str:
+        systems = self.systems()
+        width = 0.0
+        for i, notes in enumerate(systems):
+            staff_top = i * SYSTEM_HEIGHT + STAFF_OFFSET
+            x = self.clef(staff_top)
+            x = self.key_signature(staff_top, x)
+            if i == 0:
+                x = self.time_signature(staff_top, x)
+            placed, bars, end = self.place(notes, x + 0.5 * S)
+            for p in placed:
+                if p.rest:
+                    self.rest(staff_top, p)
+                else:
+                    self.ledger_lines(staff_top, p)
+                    self.notehead(staff_top, p)
+            self.stems_and_beams(staff_top, placed)
+            self.triplets(staff_top, placed)
+            self.slurs(staff_top, placed)
+            self.lyrics(staff_top, placed)
+            self.bar_lines(staff_top, bars)
+            end = max(end, bars[-1] + 1.0 if bars else end)
+            self.staff(staff_top, end)
+            width = max(width, end)
+
+        width = math.ceil(width + LEFT_MARGIN)
+        height = math.ceil(max(1, len(systems)) * SYSTEM_HEIGHT)
+        body = '\n'.join(self.out.paths + self.out.texts)
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}"'
+                f' viewBox="0 0 {width} {height}">\n{body}\n</svg>\n')
+
+
+def engrave_piece(music_fields: dict) -> str | None:
+    ''' SVG for one piece, or None if it has no notes at all '''
+    state = MusicState(dict(music_fields))
+    if not state.music:
+        return None
+    return Engraver(state.piece, state.music).svg()
+
+
+def _engrave_job(job: tuple[int, dict]) -> tuple[int, str | None]:
+    number, music_fields = job
+    return number, engrave_piece(music_fields)
+
+
+def engrave_catalog(catalog, out_dir: Path = Path('Images'), workers: int = 1) -> dict[str, int]:
+    ''' write out_dir/notation{N}.svg for every version; files whose content
+        hasn't changed are left alone so their mtimes (and anything keyed on
+        them) stay put '''
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(v.number, v.music_fields) for v in catalog.versions()]
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_engrave_job, jobs, chunksize=16))
+    else:
+        results = [_engrave_job(job) for job in jobs]
+
+    counts = {'written': 0, 'unchanged': 0, 'skipped': 0}
+    for number, svg in results:
+        if svg is None:
+            print(f"notation{number} has no notes to engrave")
+            counts['skipped'] += 1
+            continue
+        path = out_dir / f'notation{number}.svg'
+        try:
+            if path.read_text(encoding='utf-8') == svg:
+                counts['unchanged'] += 1
+                continue
+        except FileNotFoundError:
+            pass
+        atomic_write_text(path, svg)
+        counts['written'] += 1
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    from parse import load_catalog, parse_music
+    parser = argparse.ArgumentParser(description="Engrave every incipit to Images/notation{N}.svg")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--out', default='Images')
+    parser.add_argument('--catalog', help="a catalog snapshot (as build.py writes) to engrave instead of parsing")
+    args = parser.parse_args()
+    catalog = load_catalog(args.catalog) if args.catalog else parse_music(tsv_path=None, workers=args.workers)
+    print(engrave_catalog(catalog, Path(args.out), args.workers))
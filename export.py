@@ -0,0 +1,171 @@
+''' export the catalog as a static site, one page per section
+
+    python export.py [--out site] [--tempo 108] [--catalog .cache/build-catalog.pickle]
+
+Each "# section" of incipits.txt gets a page with only its own rows and
+ABC, numbered from 1 within the page, so no page grows with the whole
+catalog and adding a piece only changes the page it lands on.  index.html
+lists the sections and searches titles and composers from a JSON payload
+that it fetches on first use.  Each version's MIDI file (see midi.py) is
+copied alongside and linked from its row.
+
+Scripts, stylesheets and the search payload get content-hashed names, so
+they can be cached for good; pages keep stable names.  Every file is also
+written as .gz, and as .br when the brotli module is installed, for a
+server that serves precompressed files.  Brotli's slowest setting, which
+takes about a second for abcjs alone, is kept for the scripts and
+stylesheets, whose hashed names mean they are compressed once; pages,
+which change with every edit, get a quality that is some forty times
+faster for about a tenth more bytes.  Files whose bytes haven't
+changed are left alone, and files an earlier export wrote but this one
+didn't (old hashed assets, removed sections) are deleted, so publishing
+the directory with rsync only moves what changed.
+'''
+
+import datetime
+import gzip
+import hashlib
+import json
+from pathlib import Path
+import re
+
+from flask import Flask, render_template
+
+from atomic import atomic_open
+from midi import DEFAULT_TEMPO, MIDI_DIR, write_midi
+from render import section_rows, tunes_payload
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SITE_DIR = Path('site')
+STATIC_DIR = Path('static')
+ASSETS = ('abcjs_basic_5.9.1-min.js', 'audio.css', 'tefillot.css', 'tefillot.js', 'site.js')
+COMPRESSED = ('.gz', '.br')
+PAGE_QUALITY = 5
+ASSET_QUALITY = 11
+
+
+def content_name(name: str, data: bytes) -> str:
+    ''' audio.css -> audio.0123456789.css '''
+    stem, dot, ext = name.rpartition('.')
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:10]}.{ext}'
+
+
+def section_page(title: str | None, taken: set[str]) -> str:
+    slug = re.sub(r'[^a-z0-9]+', '-', (title or 'other').lower()).strip('-') or 'section'
+    page = f'{slug}.html'
+    n = 1
+    while page in taken:
+        n += 1
+        page = f'{slug}-{n}.html'
+    taken.add(page)
+    return page
+
+
+class SiteWriter:
+    def __init__(self, out_dir: Path):
+        self.out_dir = out_dir
+        self.produced: set[str] = set()
+        self.written = 0
+        self.unchanged = 0
+
+    def compressed(self, data: bytes, quality: int = PAGE_QUALITY) -> dict[str, bytes]:
+        # mtime=0 so the same page always compresses to the same bytes
+        copies = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            copies['.br'] = brotli.compress(data, quality=quality)
+        return copies
+
+    def write(self, name: str, data: bytes, compress: bool = True, quality: int = PAGE_QUALITY) -> None:
+        path = self.out_dir / name
+        suffixes = ['']
+        if compress:
+            suffixes += ['.gz'] + (['.br'] if brotli is not None else [])
+        self.produced.update(name + suffix for suffix in suffixes)
+        if all((self.out_dir / (name + suffix)).exists() for suffix in suffixes) \
+                and path.read_bytes() == data:
+            self.unchanged += 1
+            return
+        for suffix, contents in [('', data), *(self.compressed(data, quality).items() if compress else [])]:
+            with atomic_open(self.out_dir / (name + suffix), 'wb') as f:
+                f.write(contents)
+        self.written += 1
+
+    def prune(self) -> int:
+        ''' remove what earlier exports wrote and this one didn't '''
+        removed = 0
+        for path in self.out_dir.iterdir():
+            if path.is_file() and path.name not in self.produced \
+                    and path.suffix in ('.html', '.js', '.css', '.json', '.mid', *COMPRESSED):
+                path.unlink()
+                removed += 1
+        return removed
+
+
+def export_site(catalog, out_dir: Path = SITE_DIR, tempo: int = DEFAULT_TEMPO) -> dict[str, int]:
+    ''' needs a Flask app context, for render_template '''
+    out_dir.mkdir(parents=True, exist_ok=True)
+    site = SiteWriter(out_dir)
+
+    # MIDI files are already compressed about as far as they will go
+    midi = write_midi(catalog, MIDI_DIR, tempo)
+    for name in set(midi.values()):
+        site.write(name, (MIDI_DIR / name).read_bytes(), compress=False)
+
+    assets = {}
+    for name in ASSETS:
+        data = (STATIC_DIR / name).read_bytes()
+        assets[name] = content_name(name, data)
+        site.write(assets[name], data, quality=ASSET_QUALITY)
+
+    taken = set()
+    pages = [{'title': section.title or 'Other', 'page': section_page(section.title, taken),
+              'incipits': len(section.incipits),
+              'versions': sum(len(incipit.versions) for incipit in section.incipits)}
+             for section in catalog.sections]
+
+    search = []
+    for i, (section, page) in enumerate(zip(catalog.sections, pages)):
+        tunes = {}
+        anchors = {}
+        rows = section_rows(section, True, tunes, local_numbers=True, anchors=anchors, midi=midi)
+        html = render_template('section.html', title=page['title'], assets=assets,
+                               table_body='\n'.join(rows), tunes=tunes_payload(tunes),
+                               prev=pages[i - 1] if i > 0 else None,
+                               next=pages[i + 1] if i + 1 < len(pages) else None)
+        site.write(page['page'], html.encode('utf-8'))
+        for incipit in section.incipits:
+            composers = dict.fromkeys(v.composer.lstrip('.') for v in incipit.versions)
+            search.append([incipit.title, '; '.join(composers), f"{page['page']}#{anchors[incipit.title]}"])
+
+    payload = json.dumps(search, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    assets['search.json'] = content_name('search.json', payload)
+    site.write(assets['search.json'], payload)
+
+    # the date, not the time, so re-exporting the same catalog on the same day changes nothing
+    index = render_template('site_index.html', assets=assets, sections=pages,
+                            date=datetime.datetime.now(tz=datetime.timezone.utc).date().isoformat())
+    site.write('index.html', index.encode('utf-8'))
+
+    return {'written': site.written, 'unchanged': site.unchanged, 'removed': site.prune()}
+
+
+if __name__ == '__main__':
+    import argparse
+    from parse import load_catalog, parse_music
+    parser = argparse.ArgumentParser(description="Export the catalog as a static site")
+    parser.add_argument('--out', default=str(SITE_DIR))
+    parser.add_argument('--tempo', type=int, default=DEFAULT_TEMPO, help="for the MIDI files, in quarter notes per minute")
+    parser.add_argument('--catalog', help="a catalog snapshot (as build.py writes) to export instead of parsing")
+    args = parser.parse_args()
+
+    catalog = load_catalog(args.catalog) if args.catalog else parse_music(tsv_path=None)
+    app = Flask(__name__, template_folder='Templates')
+    with app.app_context():
+        counts = export_site(catalog, Path(args.out), args.tempo)
+    print(f"{counts['written']} files written, {counts['unchanged']} unchanged, {counts['removed']} removed")
+    if brotli is None:
+        print("brotli isn't installed; wrote .gz copies only")
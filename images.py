@@ -1,11 +1,124 @@
-from bs4 import BeautifulSoup
-
-h = BeautifulSoup(open('expanded.html'), 'html.parser')
-for svg in h.find_all('svg'):
-    notation = svg.parent.attrs.get('id')
-    if notation is None:
-        continue
-    # print(notation)
-    with open(f'Images/{notation}.svg', 'w', encoding='utf-8') as f:
-        print(svg.prettify(), file=f)
-print(notation)
+''' pull the notation SVGs out of the page that the browser posted back
+
+    The document is streamed through html.parser rather than loaded into
+    one big tree: each <svg> inside a notation* element is written to
+    Images/ as soon as its closing tag arrives, exactly as the browser
+    serialised it (no prettifying), and only if its content changed.
+'''
+
+import codecs
+import hashlib
+from html.parser import HTMLParser
+from pathlib import Path
+
+from atomic import atomic_open
+from metrics import metrics
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+
+class SvgExtractor(HTMLParser):
+    def __init__(self, out_dir='Images'):
+        super().__init__(convert_charrefs=False)
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.stack = []         # (tag, id) of open elements outside any svg
+        self.svg_name = None    # e.g. 'notation12' while inside its svg
+        self.svg_parts = []
+        self.svg_tags = []      # original-case tag names open inside the svg
+        self.written = 0
+        self.unchanged = 0
+        self.last = None
+
+    def feed_bytes(self, chunk: bytes) -> None:
+        self.feed(self.decoder.decode(chunk))
+
+    def finish(self) -> None:
+        self.feed(self.decoder.decode(b'', final=True))
+        self.close()
+
+    def handle_starttag(self, tag, attrs):
+        if self.svg_name is not None:
+            raw = self.get_starttag_text()
+            self.svg_parts.append(raw)
+            self.svg_tags.append(raw[1:].split(None, 1)[0].rstrip('>'))
+            return
+        if tag == 'svg':
+            parent_id = self.stack[-1][1] if self.stack else None
+            if parent_id and parent_id.startswith('notation'):
+                self.svg_name = parent_id
+                self.svg_parts = [self.get_starttag_text()]
+                self.svg_tags = ['svg']
+                return
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, dict(attrs).get('id')))
+
+    def handle_startendtag(self, tag, attrs):
+        if self.svg_name is not None:
+            self.svg_parts.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if self.svg_name is not None:
+            name = self.svg_tags.pop() if self.svg_tags else tag
+            self.svg_parts.append(f'</{name}>')
+            if not self.svg_tags:
+                self.write_svg()
+            return
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                del self.stack[i:]
+                break
+
+    def handle_data(self, data):
+        if self.svg_name is not None:
+            self.svg_parts.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(f'&{name};')
+
+    def handle_charref(self, name):
+        self.handle_data(f'&#{name};')
+
+    def write_svg(self):
+        content = ''.join(self.svg_parts).encode('utf-8')
+        path = self.out_dir / f'{self.svg_name}.svg'
+        self.last = self.svg_name
+        self.svg_name = None
+        self.svg_parts = []
+        try:
+            if hashlib.sha256(path.read_bytes()).digest() == hashlib.sha256(content).digest():
+                self.unchanged += 1
+                metrics.inc('tefillot_svgs_total', outcome='unchanged')
+                return
+        except FileNotFoundError:
+            pass
+        with atomic_open(path, 'wb') as f:
+            f.write(content)
+        self.written += 1
+        metrics.inc('tefillot_svgs_total', outcome='written')
+        metrics.inc('tefillot_bytes_written_total', len(content), output='Images')
+
+
+def extract_svgs(chunks, out_dir='Images', copy_to=None) -> SvgExtractor:
+    ''' feed an iterable of byte chunks through the extractor, optionally
+        also saving the whole document to `copy_to` '''
+    extractor = SvgExtractor(out_dir)
+    if copy_to is None:
+        for chunk in chunks:
+            extractor.feed_bytes(chunk)
+    else:
+        with atomic_open(copy_to, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                extractor.feed_bytes(chunk)
+    extractor.finish()
+    return extractor
+
+
+if __name__ == '__main__':
+    with open('expanded.html', 'rb') as f:
+        e = extract_svgs(iter(lambda: f.read(1 << 16), b''))
+    print(f"{e.written} written, {e.unchanged} unchanged")
+    print(e.last)
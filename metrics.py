@@ -0,0 +1,164 @@
+''' counters and timing spans for the build and the Flask routes
+
+    Everything goes into one process-wide registry, `metrics`, and comes
+    out in Prometheus text format from render() (served at /metrics).
+
+        metrics.inc('tefillot_pieces_parsed_total', book='Zamru Lo II')
+        with metrics.span('yaml_file', file='zamru_lo_v2'):
+            ...
+
+    A span adds its duration to tefillot_span_seconds{span=...}; while a
+    trace() is open on the same thread it is also recorded as an event in
+    the Chrome trace format, so a whole build can be dumped and opened in
+    chrome://tracing or Perfetto.  Counts kept in worker processes (parse
+    --workers N) are not collected.
+'''
+
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+HELP = {
+    'tefillot_span_seconds': 'Time spent in each instrumented stage',
+    'tefillot_request_seconds': 'Request latency per route',
+    'tefillot_requests_total': 'Requests per route and status',
+    'tefillot_yaml_files_parsed_total': 'YAML files parsed (not served from the catalog cache)',
+    'tefillot_pieces_parsed_total': 'Pieces parsed, per source book',
+    'tefillot_notes_total': 'Notes emitted by MusicState',
+    'tefillot_bytes_written_total': 'Bytes written, per output',
+    'tefillot_saves_total': 'Saves from the editor, per outcome',
+    'tefillot_svgs_total': 'Notation SVGs received from the browser, per outcome',
+}
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+
+
+def format_value(value) -> str:
+    ''' ints as they are, floats at full precision (as prometheus_client
+        does), so a big counter doesn't turn into 1.23457e+06 '''
+    if isinstance(value, int):
+        return str(value)
+    value = float(value)
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.events: list[dict] = []
+
+    def add(self, name: str, start: float, seconds: float, labels: dict) -> None:
+        self.events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': round((start - self.start) * 1e6),
+            'dur': round(seconds * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': labels,
+        })
+
+    def chrome_json(self) -> str:
+        return json.dumps({'traceEvents': self.events, 'otherData': {'trace': self.name}})
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict[str, dict[tuple, float]] = defaultdict(lambda: defaultdict(int))
+        self.summaries: dict[str, dict[tuple, list[float]]] = defaultdict(dict)
+        self.collectors = []
+        self.local = threading.local()
+        self.last_trace: Trace | None = None
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.counters[name][key] += amount
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            count_sum = self.summaries[name].setdefault(key, [0, 0.0])
+            count_sum[0] += 1
+            count_sum[1] += seconds
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe('tefillot_span_seconds', seconds, span=name, **labels)
+            trace = getattr(self.local, 'trace', None)
+            if trace is not None:
+                trace.add(name, start, seconds, labels)
+
+    @contextmanager
+    def trace(self, name: str):
+        ''' record every span on this thread until the block ends; the
+            result is kept as last_trace '''
+        trace = Trace(name)
+        self.local.trace = trace
+        try:
+            with self.span(name):
+                yield trace
+        finally:
+            self.local.trace = None
+            self.last_trace = trace
+
+    def register_collector(self, fn) -> None:
+        ''' fn() -> [(name, type, labels dict, value)], read at render time,
+            for numbers something else already keeps (e.g. cache stats) '''
+        self.collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+
+        def header(name, kind):
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            summaries = {name: {k: list(v) for k, v in series.items()}
+                         for name, series in self.summaries.items()}
+        for name in sorted(counters):
+            header(name, 'counter')
+            for labels, value in sorted(counters[name].items(), key=str):
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        for name in sorted(summaries):
+            header(name, 'summary')
+            for labels, (count, total) in sorted(summaries[name].items(), key=str):
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+                lines.append(f'{name}_sum{format_labels(labels)} {total:.6f}')
+        for collector in self.collectors:
+            by_name = defaultdict(list)
+            for name, kind, labels, value in collector():
+                by_name[(name, kind)].append((tuple(sorted(labels.items())), value))
+            for (name, kind), series in by_name.items():
+                header(name, kind)
+                for labels, value in series:
+                    lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,127 @@
+''' a small Standard MIDI File for every version, written at build time
+
+    python midi.py [--tempo 108]      writes static/midi/<hash>.mid
+
+Each file is built straight from MusicState's note list: pitches with the
+key signature and accidentals applied, exact lengths (tuplets included),
+and the key and time signatures as meta events.  Files are named by a
+hash of the fields they are made from, the tempo and this code, so an
+unchanged piece is never written twice and the page can link to its file
+without reading it.  Files no version uses any more are removed.
+'''
+
+from fractions import Fraction
+import hashlib
+from pathlib import Path
+import struct
+
+from abc_cache import piece_key
+from atomic import atomic_open
+from parse import TICKS_PER_WHOLE, MusicState, code_hash
+from theory import key_signature, midi_pitches
+
+MIDI_DIR = Path('static/midi')
+DEFAULT_TEMPO = 108   # quarter notes per minute
+PPQ = 480             # ticks per quarter; divisible by 3 and 5, so triplets are exact
+VELOCITY = 80
+
+
+def varlen(n: int) -> bytes:
+    ''' MIDI's variable-length quantity: 7 bits per byte, high bit = more '''
+    out = [n & 0x7f]
+    n >>= 7
+    while n:
+        out.append(0x80 | (n & 0x7f))
+        n >>= 7
+    return bytes(reversed(out))
+
+
+def meta(kind: int, data: bytes) -> bytes:
+    return bytes([0xff, kind]) + varlen(len(data)) + data
+
+
+def header_events(music_fields: dict, tempo: int) -> list[bytes]:
+    events = [meta(0x51, (60_000_000 // tempo).to_bytes(3, 'big'))]
+    time = str(music_fields.get('time') or '')
+    if '/' in time:
+        beats, unit = time.split('/', 1)
+        if beats.isdigit() and unit.isdigit() and int(unit) & (int(unit) - 1) == 0:
+            events.append(meta(0x58, bytes([int(beats), int(unit).bit_length() - 1, 24, 8])))
+    key = music_fields.get('key')
+    if key:
+        minor = str(key).strip().endswith('m')
+        events.append(meta(0x59, struct.pack('>bB', key_signature(key), minor)))
+    return events
+
+
+def midi_bytes(music_fields: dict, tempo: int = DEFAULT_TEMPO) -> bytes:
+    ''' a format 0 file: one track, one channel '''
+    music = MusicState(dict(music_fields)).music
+    track = [b'\x00' + event for event in header_events(music_fields, tempo)]
+    ticks_per_whole = Fraction(4 * PPQ, TICKS_PER_WHOLE)
+    elapsed = 0      # in MusicState ticks, from the start of the piece
+    last_event = 0   # in MIDI ticks
+    for note, pitch in zip(music, midi_pitches(music, music_fields.get('key'))):
+        start = round(elapsed * ticks_per_whole)
+        elapsed += note.length_ticks
+        if pitch is None or not 0 <= pitch < 128:
+            continue
+        end = round(elapsed * ticks_per_whole)
+        track.append(varlen(start - last_event) + bytes([0x90, pitch, VELOCITY]))
+        track.append(varlen(end - start) + bytes([0x80, pitch, 0]))
+        last_event = end
+    # let a trailing rest run out before the track ends
+    track.append(varlen(round(elapsed * ticks_per_whole) - last_event) + meta(0x2f, b''))
+    body = b''.join(track)
+    return (b'MThd' + struct.pack('>IHHH', 6, 0, 1, PPQ)
+            + b'MTrk' + struct.pack('>I', len(body)) + body)
+
+
+def midi_salt(tempo: int) -> str:
+    # code_hash covers the tokenizer and theory.py, which decide the notes
+    return code_hash() + hashlib.sha256(Path(__file__).read_bytes()).hexdigest() + str(tempo)
+
+
+def midi_name(music_fields: dict, salt: str) -> str:
+    return piece_key(music_fields, salt)[:20] + '.mid'
+
+
+def write_midi_file(music_fields: dict, out_dir: Path = MIDI_DIR, tempo: int = DEFAULT_TEMPO,
+                    salt: str | None = None) -> str:
+    ''' the file name for one piece, writing the file unless it's there already '''
+    name = midi_name(music_fields, salt or midi_salt(tempo))
+    path = out_dir / name
+    if not path.exists():
+        out_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_open(path, 'wb') as f:
+            f.write(midi_bytes(music_fields, tempo))
+    return name
+
+
+def write_midi(catalog, out_dir: Path = MIDI_DIR, tempo: int = DEFAULT_TEMPO) -> dict[int, str]:
+    ''' {version number: file name in out_dir}, writing only the files
+        that aren't there yet '''
+    out_dir.mkdir(parents=True, exist_ok=True)
+    salt = midi_salt(tempo)
+    names = {}
+    before = {path.name for path in out_dir.glob('*.mid')}
+    for version in catalog.versions():
+        if version.music_fields:
+            names[version.number] = write_midi_file(version.music_fields, out_dir, tempo, salt)
+    used = set(names.values())
+    written = len(used - before)
+    stale = [path for path in out_dir.glob('*.mid') if path.name not in used]
+    for path in stale:
+        path.unlink()
+    print(f"MIDI: {written} written, {len(used) - written} unchanged, {len(stale)} removed")
+    return names
+
+
+if __name__ == '__main__':
+    import argparse
+    from parse import parse_music
+    parser = argparse.ArgumentParser(description="Write a MIDI file for every version")
+    parser.add_argument('--tempo', type=int, default=DEFAULT_TEMPO, help="quarter notes per minute")
+    parser.add_argument('--out', default=str(MIDI_DIR))
+    args = parser.parse_args()
+    write_midi(parse_music(tsv_path=None), Path(args.out), args.tempo)
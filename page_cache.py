@@ -0,0 +1,61 @@
+''' in-memory cache of the rendered index page for the Flask app '''
+
+import hashlib
+from pathlib import Path
+import threading
+import time
+
+INPUT_GLOBS = ('data/*.yaml', 'saves.json', 'incipits.txt', 'Templates/main.html')
+
+
+def input_fingerprint() -> tuple:
+    ''' cheap stat-only signature of everything the page is built from '''
+    sig = []
+    for pattern in INPUT_GLOBS:
+        for p in sorted(Path('.').glob(pattern)):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            sig.append((str(p), st.st_size, st.st_mtime_ns))
+    return tuple(sig)
+
+
+class PageCache:
+    ''' Holds the last rendered page and its ETag.  When the inputs change,
+        exactly one caller runs `build_fn`; everyone else who arrives in the
+        meantime waits on the lock and then gets the freshly built page.
+
+        The inputs are only re-stat'ed every `check_interval` seconds, so
+        a burst of requests is served straight from memory.
+    '''
+
+    def __init__(self, build_fn, check_interval: float = 0.5):
+        self.build_fn = build_fn
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.checked_at = 0.0
+        # (page, etag), swapped as one object so readers never see a mismatch
+        self.current: tuple[str, str] | None = None
+
+    def get(self) -> tuple[str, str]:
+        now = time.monotonic()
+        current = self.current
+        if current is not None and now - self.checked_at < self.check_interval:
+            return current
+        fingerprint = input_fingerprint()
+        self.checked_at = now
+        if current is not None and fingerprint == self.fingerprint:
+            return current
+        with self.lock:
+            if self.current is None or fingerprint != self.fingerprint:
+                page = self.build_fn()
+                self.current = (page, hashlib.sha256(page.encode('utf-8')).hexdigest())
+                self.fingerprint = fingerprint
+            return self.current
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.fingerprint = None
+            self.checked_at = 0.0
@@ -1,19 +1,91 @@
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from fractions import Fraction
+from functools import cache
+import hashlib
+import heapq
 from itertools import zip_longest
-import json
 from pathlib import Path
-
-import yaml
+import pickle
 import re
-
-
-@dataclass
+import tempfile
+import threading
+from typing import Iterator
+
+from abc_cache import AbcCache, ABC_FIELDS
+from atomic import atomic_open, atomic_write_text
+from catalog import Catalog, Section, Incipit, Version, Source, write_tsv
+from catalog_cache import CatalogCache
+from metrics import metrics
+from save_log import SAVES_PATH, SaveLog, parse_line
+from theory import duration_fraction
+from titles import TitleIndex, read_incipit_lines
+from tokenizer import NotationError, abc_to_notes, note_column, notes_errors, scan_notes, scan_lyrics
+
+
+# Beat positions and lengths are counted in ticks, which is exact (and
+# much cheaper than Fractions) for everything down to dotted 256ths,
+# also in tuplets of up to 9.
+TICKS_PER_WHOLE = 2**14 * 3**3 * 5 * 7
+
+# the modules a parsed catalog depends on (build.py's PARSE_CODE)
+CODE_MODULES = ('parse.py', 'catalog.py', 'tokenizer.py', 'theory.py', 'titles.py',
+                'save_log.py', 'abc_cache.py', 'catalog_cache.py')
+
+
+def ticks(whole_notes: Fraction) -> int:
+    return int(whole_notes * TICKS_PER_WHOLE)
+
+
+# positions in the measure that end a beam
+DONT_BEAM_ACROSS: dict[str, frozenset[int]] = {
+    '4/4': frozenset({ticks(Fraction(2, 4))}),
+    '6/8': frozenset({ticks(Fraction(3, 8))}),
+    '3/4': frozenset({ticks(Fraction(1, 3)), ticks(Fraction(2, 3))}),
+    '2/2': frozenset({ticks(Fraction(1, 2))}),
+    '2/4': frozenset({ticks(Fraction(1, 4))}),
+}
+
+
+def tuplet_ratio(count: int, time: str) -> tuple[int, int]:
+    ''' a &N prefix puts the next N notes in the time of (in_time_of, N),
+        as ABC's (N does: 3 in the time of 2, 2 in the time of 3, ... '''
+    compound = time in ('6/8', '9/8', '12/8')
+    in_time_of = {2: 3, 3: 2, 4: 3, 6: 2, 8: 3}.get(count, 3 if compound else 2)
+    return in_time_of, count
+
+
+@cache
+def note_ticks(duration: str, tuplet: tuple[int, int] = (1, 1)) -> int:
+    ''' '8.' -> 3/16 of a whole note, in ticks; ValueError for '0' and
+        for lengths the ticks can't represent exactly '''
+    try:
+        length = duration_fraction(duration) * Fraction(*tuplet) * TICKS_PER_WHOLE
+    except (ValueError, ZeroDivisionError):
+        raise ValueError(f"bad duration {duration!r}") from None
+    if length.denominator != 1 or length <= 0:
+        raise ValueError(f"bad duration {duration!r}")
+    return int(length)
+
+
+@cache
+def abc_length(duration: str) -> str:
+    ''' the ABC length suffix for a duration, with L:1/8: '8' -> '', '4' -> '2', '16.' -> '3/4' '''
+    ratio = duration_fraction(duration) * 8
+    if ratio == 1:
+        return ''
+    if ratio.denominator == 1:
+        return str(ratio.numerator)
+    return f'{ratio.numerator}/{ratio.denominator}'
+
+
+@dataclass(slots=True)
 class Note:
     octave: int
     note_name: str
     duration: str
-    beat_position: float = 0
+    beat_ticks: int = 0
+    length_ticks: int = 0  # what it actually lasts, after any tuplet
     lyric: str = ''
     trailing_bar: bool = False
     trailing_space: bool = False # to break beams
@@ -21,53 +93,63 @@ class Note:
     close_paren: bool = False
     triplet_prefix: str = ''
 
+    @property
+    def beat_position(self) -> Fraction:
+        ''' from the start of the measure, in whole notes '''
+        return Fraction(self.beat_ticks, TICKS_PER_WHOLE)
 
-class MusicState:
-    NOTE_PARTS_RE = re.compile(r'(\(?)(\&\d)?([\^v]?)([abcdefgr][+@-]?)(\d*\.?)(\)?)(\`)?')
+    @property
+    def length(self) -> Fraction:
+        return Fraction(self.length_ticks, TICKS_PER_WHOLE)
 
+
+class MusicState:
     # iterate down the list of notes statefully,
     # creating a list of Note objects that are stateless
     def __init__(self, piece: dict):
         self.piece = piece
         self.debugging = piece.get('debug')
         self.music : list[Note] = []
+        self.diagnostics = []
         state : Note = Note(octave = 4,
                             note_name = 'x',
                             duration = '4')
-        dont_beam_across : list[float]= {
-            '4/4': [2/4],
-            '6/8': [3/8],
-            '3/4': [1/3, 2/3],
-            '2/2': [1/2],
-            '2/4': [1/4],
-        }.get(piece.get('time', '4/4'), [])
+        time = piece.get('time', '4/4')
+        dont_beam_across = DONT_BEAM_ACROSS.get(time, frozenset())
+        tuplet_left = 0
+        tuplet = (1, 1)
 
         if 'notes' not in piece:
             piece['notes'] = ''
 
+        notes = piece['notes']
+        flowing_lyrics = None
         if 'notes_abc' in piece:
-            return
+            # abc() passes notes_abc through untouched; translating it just
+            # gives the engraver (and anything else that wants pitches) a
+            # note list.  ABC lyrics without bars flow across them.
+            notes, errors = abc_to_notes(piece['notes_abc'])
+            self.report(errors)
+            if '|' not in (piece.get('lyrics') or ''):
+                flowing_lyrics = [s for m in self.parse_lyrics(piece.get('lyrics')) for s in m]
 
         if self.debugging:
-            print(self.parse_notes(piece['notes']))
+            print(self.parse_notes(notes))
 
 
-        parsed_notes = self.parse_notes(piece['notes'])
+        parsed_notes = self.parse_notes(notes)
         parsed_lyrics = self.parse_lyrics(piece.get('lyrics'))
         while len(parsed_lyrics) < len(parsed_notes):
             parsed_lyrics += [[""]]
 
-        for measure in zip(parsed_notes, parsed_lyrics):
-            current_beat = 0.0
-            lyric_syllables = [] + measure[1]
-
-            for note in measure[0]:
-                if note is None:
-                    print("Not a match:", piece['title'], note)
-                    continue
-                if len(note) == 0:
-                    continue  # but why?
+        for measure_number, measure in enumerate(zip(parsed_notes, parsed_lyrics)):
+            current_beat = 0
+            if flowing_lyrics is not None:
+                lyric_syllables = flowing_lyrics
+            else:
+                lyric_syllables = [] + measure[1]
 
+            for note_number, note in enumerate(measure[0]):
                 open_paren, triplet_prefix, octave_change, note_name, duration, close_paren, break_beams = note
                 if octave_change == 'v':
                     state.octave -= 1
@@ -75,20 +157,34 @@ class MusicState:
                     state.octave += 1
                 state.note_name = note_name
                 if duration:
-                    if duration == '.':
-                        state.duration += '.'
-                    else:
-                        state.duration = duration
-
-                # TODO: Account for triplets
-
-                duration_ratio = 1/int(state.duration.replace('.', ''))
-                if state.duration.endswith('.'):
-                    duration_ratio *= 1.5
-                next_beat = current_beat + duration_ratio
+                    new_duration = state.duration + '.' if duration == '.' else duration
+                    try:
+                        note_ticks(new_duration)
+                        state.duration = new_duration
+                    except ValueError:
+                        # keep the previous length, as if none were given
+                        part = 'duration' if duration[0].isdigit() else 'dot'
+                        column = note_column(notes, measure_number, note_number, part)
+                        self.report([NotationError(duration, measure_number, column, source='duration')])
+
+                if triplet_prefix and int(triplet_prefix[1:]) > 1:
+                    tuplet_left = int(triplet_prefix[1:])
+                    tuplet = tuplet_ratio(tuplet_left, time)
+                if tuplet_left:
+                    tuplet_left -= 1
+                    try:
+                        length = note_ticks(state.duration, tuplet)
+                    except ValueError:
+                        column = note_column(notes, measure_number, note_number)
+                        self.report([NotationError(state.duration, measure_number, column, source='tuplet')])
+                        length = note_ticks(state.duration)
+                else:
+                    length = note_ticks(state.duration)
+                next_beat = current_beat + length
 
                 trailing_space = break_beams == '`'
-                if next_beat in dont_beam_across:
+                # (but never in the middle of a tuplet)
+                if next_beat in dont_beam_across and not tuplet_left:
                     trailing_space = True
 
                 if note_name == 'r' or len(lyric_syllables) == 0:
@@ -100,7 +196,8 @@ class MusicState:
                     octave = state.octave,
                     note_name = state.note_name,
                     duration = state.duration,
-                    beat_position = current_beat,
+                    beat_ticks = current_beat,
+                    length_ticks = length,
                     lyric = lyric,
                     open_paren = open_paren == '(',
                     close_paren = close_paren == ')',
@@ -113,7 +210,7 @@ class MusicState:
             if self.music:
                 self.music[-1].trailing_bar = True
 
-            self.add_implied_parens()
+        self.add_implied_parens()
 
     def add_implied_parens(self):
         last_index_with_lyric = None
@@ -136,27 +233,19 @@ class MusicState:
             self.music[-1].close_paren = True
 
     def parse_notes(self, s:str) -> list[list[tuple[str, str, str, str, str, str, str]]]:
-        measures = re.split(r'\s*\|\s*', s)
-        notes = [
-            MusicState.NOTE_PARTS_RE.findall(
-                m.replace(' ', '')
-            )
-            for m in measures
-        ]
-        # print(notes)
+        notes, errors = scan_notes(s)
+        self.report(errors)
         return notes
 
+    def report(self, errors) -> None:
+        for error in errors:
+            print(f"{self.piece.get('title')}: {error}")
+        self.diagnostics.extend(errors)
+
     def parse_lyrics(self, s) -> list[list[str]]:
-        if s is None:
-            return [['']]
         # hyphens END a syllable and imply a trailing space
         # underscores ARE a syllable an imply both leading and trailing spaces
-        s_with_implicit_spaces = s.replace('-', '- ').replace('_', ' _ ') #.replace("'", "’")
-        measures = re.split(r'\s*\|\s*', s_with_implicit_spaces)
-        lyrics = [
-            m.split() for m in measures
-            ]
-        return lyrics
+        return scan_lyrics(s)
 
     def abc_notes(self):
         # old-style legacy mode
@@ -215,23 +304,7 @@ class MusicState:
                     accidentals[note_letter] = ''
 
             # default note length is 1/8
-            try:
-                len_numerator = 8/int(note.duration.replace('.', ''))
-            except:
-                print(f"Exception for note with duration {note.duration}")
-            if note.duration.endswith('.'):
-                len_numerator *= 1.5  # TODO: double-dots
-            len_denominator = 1.0
-            while len_numerator != int(len_numerator):
-                len_numerator *= 2
-                len_denominator *= 2
-            if len_denominator == 1:
-                if len_numerator == 1:
-                    len_ratio = ''
-                else:
-                    len_ratio = str(int(len_numerator))
-            else:
-                len_ratio = f'{int(len_numerator):d}/{int(len_denominator):d}'
+            len_ratio = abc_length(note.duration)
 
             matching_lyrics.append(note.lyric)
 
@@ -285,6 +358,36 @@ class MusicState:
         return heading + body
 
 
+@cache
+def code_hash() -> str:
+    # any edit to the parser, or to a module whose output it caches,
+    # invalidates everything it has cached
+    h = hashlib.sha256()
+    here = Path(__file__).parent
+    for name in CODE_MODULES:
+        h.update(f'{name}\0'.encode('utf-8') + (here / name).read_bytes())
+    return h.hexdigest()
+
+
+def music_to_abc(piece:dict) -> str:
+    # (a copy: MusicState fills in defaults, which mustn't leak into
+    # music_fields only when the ABC wasn't cached)
+    state = MusicState(dict(piece))
+    metrics.inc('tefillot_notes_total', len(state.music))
+    return state.abc()
+
+
+abc_cache = AbcCache(music_to_abc, salt=code_hash())
+
+
+def abc_cache_metrics() -> list[tuple]:
+    stats = abc_cache.stats()
+    return [(f'tefillot_abc_cache_{k}_total', 'counter', {}, stats[k]) for k in ('hits', 'disk_hits', 'misses')] \
+        + [('tefillot_abc_cache_entries', 'gauge', {}, stats['size'])]
+
+metrics.register_collector(abc_cache_metrics)
+
+
 @dataclass
 class ParsedPiece:
     title: str
@@ -295,37 +398,60 @@ class ParsedPiece:
     nb: str
     fk: str | None
     pk: str | None
+    # the source fields MusicState reads, for stages that need the notes
+    music_fields: dict = field(default_factory=dict)
+
+
+def load_yaml(yaml_path:Path):
+    # PyYAML is imported on first use, so tools that only read the caches
+    # never pay for it; libyaml's loader is several times faster when present
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with yaml_path.open('r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=loader)
 
 
 def parse_music_yaml(yaml_path:Path, parsed_music:dict[str, list[ParsedPiece]]) -> None:
     if '.yaml' not in str(yaml_path):
         raise ValueError(f"{yaml_path} is not a yaml file")
     print(f"Parsing YAML file {yaml_path}")
-    y = yaml.safe_load(yaml_path.open('r', encoding='utf-8'))
-    if 'Music' not in y:
-        print("No Music in", yaml_path)
-        return
-    for piece in y['Music']:
-        parse_one_piece(piece, parsed_music, y)
+    metrics.inc('tefillot_yaml_files_parsed_total', file=yaml_path.stem)
+    with metrics.span('yaml_file', file=yaml_path.stem):
+        y = load_yaml(yaml_path)
+        if 'Music' not in y:
+            print("No Music in", yaml_path)
+            return
+        for piece in y['Music']:
+            parse_one_piece(piece, parsed_music, y)
 
 def parse_one_piece(piece:dict, parsed_music:dict[str, list[ParsedPiece]], y:dict={}) -> None:
         # print(piece.get('title'))
-        music = MusicState(piece)
         book = piece.get('book', y.get('Book', '?'))
-        composer = piece.get('composer', y.get('Composer', '?'))
+        # (a save from /abc without a composer has composer: null)
+        composer = piece.get('composer') or y.get('Composer', '?')
+        metrics.inc('tefillot_pieces_parsed_total', book=book)
                 
         parsed_music[piece['title']].append(ParsedPiece(
             title = piece['title'].replace("'", "’"),
             composer = composer,
-            abc = music.abc(),
+            abc = abc_cache.abc_for(piece),
             book = book,
             page = piece.get('page', '?'),
             nb = (lambda s: 'NB: ' + s if s is not None else '')(piece.get('nb')),
             fk = piece.get('FK'),
             pk = piece.get('PK'),
+            music_fields = {k: piece[k] for k in ABC_FIELDS + ('title',) if k in piece},
             ))
         # print(music.abc())
 
+def piece_diagnostics(piece:dict) -> list[NotationError]:
+    """ what MusicState would report for `piece`, without converting it
+        (its ABC may well come out of abc_cache) """
+    if 'notes_abc' in piece:
+        return abc_to_notes(piece['notes_abc'])[1]
+    return notes_errors(piece.get('notes') or '')
+
+
 def print_counts(parsed_music: dict[str, list]) -> None:
     total_pieces = sum(len(x) for x in parsed_music.values())
     print(f"There are {total_pieces} total versions of {len(parsed_music.keys())} incipits")
@@ -344,64 +470,418 @@ def build_fks(parsed_music):
     return fks
 
 
-def parse_music():
+def parse_save_line(line:str, parsed_music:dict[str, list[ParsedPiece]]) -> None:
+    entry = parse_line(line)
+    if entry is not None:
+        parse_one_piece(entry, parsed_music)
+
+
+def latest_saves(saves:dict[str, list[ParsedPiece]]) -> dict[str, list[ParsedPiece]]:
+    """ a later save of the same title/book/page replaces the earlier one,
+        so compacting saves.json doesn't change the catalog """
+    latest = {}
+    for title, pieces in saves.items():
+        by_source = {}
+        for piece in pieces:
+            by_source.pop((piece.book, piece.page), None)
+            by_source[(piece.book, piece.page)] = piece
+        latest[title] = list(by_source.values())
+    return latest
+
+
+def merge_parsed(parsed_music:dict[str, list[ParsedPiece]], more:dict[str, list[ParsedPiece]]) -> None:
+    for title, pieces in more.items():
+        parsed_music[title].extend(pieces)
+
+
+def parse_yaml_file(yaml_path:Path) -> dict[str, list[ParsedPiece]]:
+    # top-level so that it can be shipped to a worker process
     parsed_music = defaultdict(list)
+    parse_music_yaml(yaml_path, parsed_music)
+    return parsed_music
+
+
+def map_files(fn, paths:list[Path], workers:int=1) -> list:
+    """ fn over paths, in order; spread across a process pool if workers > 1 """
+    if workers <= 1 or len(paths) <= 1:
+        return [fn(p) for p in paths]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        return list(pool.map(fn, paths))
+
+
+def count_cache(cache:CatalogCache) -> None:
+    print(f"Catalog cache: {cache.hits} hits, {cache.misses} misses")
+    metrics.inc('tefillot_catalog_cache_hits_total', cache.hits)
+    metrics.inc('tefillot_catalog_cache_misses_total', cache.misses)
+
 
-    for yaml_path in Path('data').glob('*.yaml'):
-        parse_music_yaml(yaml_path, parsed_music)
+def load_yaml_files(cache:CatalogCache, workers:int=1) -> dict[Path, dict[str, list[ParsedPiece]]]:
+    """ each YAML file's pieces, in glob order """
+    yaml_paths = list(Path('data').glob('*.yaml'))
 
-    with open('saves.json', encoding='utf-8') as f:
-        for line in f:
-            save = json.loads(line)
-            parse_one_piece(save, parsed_music)
-    # build the foreign keys lookup        
+    by_path = {}
+    stale = []
+    for yaml_path in yaml_paths:
+        parsed, stamp = cache.lookup(yaml_path, ParsedPiece)
+        if parsed is None:
+            stale.append((yaml_path, stamp))
+        else:
+            by_path[yaml_path] = parsed
+    fresh = map_files(parse_yaml_file, [p for p, _stamp in stale], workers)
+    for (yaml_path, stamp), parsed in zip(stale, fresh):
+        cache.store(yaml_path, stamp, parsed)
+        by_path[yaml_path] = parsed
+    return {yaml_path: by_path[yaml_path] for yaml_path in yaml_paths}
+
+
+def load_yaml_music(cache:CatalogCache|None, workers:int=1) -> dict[str, list[ParsedPiece]]:
+    parsed_music = defaultdict(list)
+    # results are merged back in glob order whichever worker finishes first,
+    # so the catalog (and x.tsv) come out the same as a serial build
+    if cache is None:
+        parsed_files = map_files(parse_yaml_file, list(Path('data').glob('*.yaml')), workers)
+    else:
+        parsed_files = load_yaml_files(cache, workers).values()
+    for parsed in parsed_files:
+        merge_parsed(parsed_music, parsed)
+    return parsed_music
+
+
+def load_parsed_music(use_cache:bool=True, workers:int=1) -> dict[str, list[ParsedPiece]]:
+    if not use_cache:
+        parsed_music = load_yaml_music(None, workers)
+        saves = defaultdict(list)
+        entries, _cursor, _reset = SaveLog().read()
+        for entry in entries:
+            parse_one_piece(entry, saves)
+    else:
+        cache = CatalogCache(code_hash=code_hash())
+        parsed_music = load_yaml_music(cache, workers)
+        with metrics.span('saves'):
+            saves = cache.pieces_for_log(SAVES_PATH, parse_save_line, ParsedPiece)
+        cache.save()
+        count_cache(cache)
+    merge_parsed(parsed_music, latest_saves(saves))
+    return parsed_music
+
+
+def file_stamp(path:Path) -> tuple:
+    st = path.stat()
+    return (st.st_size, st.st_mtime_ns)
+
+
+class LiveCatalog:
+    """ The parsed pieces a long-running server keeps in memory, per YAML
+        file.  Each refresh() re-parses only the files whose size or mtime
+        changed (the first one goes through the per-file disk cache) and
+        folds in only the saves appended since the last one (via the save
+        log's cursor).  A file that fails to parse keeps its last good
+        pieces, and the error is kept in `errors`. """
+
+    def __init__(self, save_log:SaveLog|None=None):
+        self.save_log = save_log or SaveLog()
+        self.yaml_files: dict[Path, tuple[tuple, dict[str, list[ParsedPiece]]]] | None = None
+        self.saves = defaultdict(list)
+        self.cursor = None
+        self.lock = threading.Lock()
+        self.changed: list[Path] = []   # the files the last refresh() re-parsed
+        self.errors: list[str] = []     # and what went wrong with them
+
+    def reload_yaml(self) -> None:
+        yaml_paths = list(Path('data').glob('*.yaml'))
+        self.changed = []
+        self.errors = []
+        if self.yaml_files is None:
+            with metrics.span('yaml_load'):
+                cache = CatalogCache(code_hash=code_hash())
+                parsed_files = load_yaml_files(cache)
+                cache.save()
+            count_cache(cache)
+            self.yaml_files = {p: (file_stamp(p), parsed) for p, parsed in parsed_files.items()}
+            return
+        yaml_files = {}
+        for yaml_path in yaml_paths:
+            stamp = file_stamp(yaml_path)
+            known = self.yaml_files.get(yaml_path)
+            if known is not None and known[0] == stamp:
+                yaml_files[yaml_path] = known
+                continue
+            self.changed.append(yaml_path)
+            try:
+                yaml_files[yaml_path] = (stamp, parse_yaml_file(yaml_path))
+            except Exception as e:
+                # typically a half-typed edit: keep the last good pieces
+                # until the file changes again
+                print(f"{yaml_path}: {e}")
+                self.errors.append(f"{yaml_path}: {e}")
+                yaml_files[yaml_path] = (stamp, known[1] if known is not None else {})
+        self.yaml_files = yaml_files
+
+    def refresh(self) -> Catalog:
+        with self.lock:
+            self.reload_yaml()
+            with metrics.span('saves'):
+                entries, self.cursor, reset = self.save_log.read(self.cursor)
+                if reset:
+                    self.saves = defaultdict(list)
+                for entry in entries:
+                    parse_one_piece(entry, self.saves)
+            print(f"Folded in {len(entries)} saves")
+
+            with metrics.span('catalog_build'):
+                parsed_music = defaultdict(list)
+                for _stamp, parsed in self.yaml_files.values():
+                    merge_parsed(parsed_music, parsed)
+                merge_parsed(parsed_music, latest_saves(self.saves))
+                print_counts(parsed_music)
+                return build_catalog(parsed_music, incipit_order(parsed_music))
+
+
+def incipit_order(parsed_music:dict[str, list[ParsedPiece]]) -> list[str]:
+    """ the lines of incipits.txt, with an =alias line synthesized after
+        the line each otherwise unlisted title normalizes to (see titles.py),
+        followed by any titles still unknown (which also get listed in
+        missing_incipits.txt) """
+    lines = read_incipit_lines()
+    index = TitleIndex(lines)
+    resolved = defaultdict(list)
+    missing_incipits = []
+    for k in parsed_music.keys():
+        if k in index.exact:
+            continue
+        line = index.resolve(k)
+        if line is None:
+            missing_incipits.append(k)
+        else:
+            resolved[line].append('=' + k)
+    with atomic_open('missing_incipits.txt') as o:
+        for k in missing_incipits:
+            print(k, file=o)
+    incipits = []
+    for line in lines:
+        incipits.append(line)
+        incipits.extend(resolved.get(line, []))
+    return incipits + sorted(missing_incipits)
+
+
+def build_catalog(parsed_music:dict[str, list[ParsedPiece]], incipits:list[str]) -> Catalog:
+    # build the foreign keys lookup
     fks = build_fks(parsed_music)
 
-    incipits = {}
-    with open('incipits.txt', encoding='utf-8') as inp:
-        for i, row in enumerate(inp):
-            incipits[row.strip()] = i
-    missing_incipits = set()
-    with open('missing_incipits.txt', 'w', encoding='utf-8') as o:
-        for k in parsed_music.keys():
-            if k not in incipits  and f"={k}" not in incipits and k not in missing_incipits:
-                print(k, file=o)
-                missing_incipits.add(k)
-    for k in sorted(list(missing_incipits)):
-        incipits[k] = len(incipits)
-
-    with open('x.tsv', 'w', encoding='utf-8') as o:
-        print('Incipit\tComposer\tMusic\tSource', file=o)
-        last_k = ''
-        for k in incipits.keys():
-            if k.startswith('# '):
-                print(k[2:], sep='\t', file=o)
+    section = Section(title=None)
+    catalog = Catalog(sections=[section])
+    last_k = ''
+    incipit = None
+    notation_number = 0
+    for k in incipits:
+        if k.startswith('# '):
+            section = Section(title=k[2:])
+            catalog.sections.append(section)
+            incipit = None
+            continue
+        if k.startswith('='):
+            k = k[1:]
+        else:
+            last_k = k
+            incipit = None
+        for row in parsed_music.get(k, []):
+            # if this row has a FK and it's a key in FKS (thus the PK exists)
+            # then skip it
+            if row.fk is not None and row.fk in fks:
                 continue
-            if k.startswith('='):
-                k = k[1:]
-            else:
+            sources = [Source(row.book, row.page)]
+            if row.pk is not None and row.pk in fks:
+                sources.extend(Source(fk_piece.book, fk_piece.page)
+                               for fk_piece in fks[row.pk])
+            if incipit is None:
+                # an alias (=Title) is filed under the title above it
+                incipit = Incipit(title=last_k)
+                section.incipits.append(incipit)
+            notation_number += 1
+            incipit.versions.append(Version(
+                number = notation_number,
+                composer = row.composer,
+                abc = row.abc,
+                sources = sources,
+                nb = row.nb,
+                music_fields = row.music_fields,
+            ))
+    if not catalog.sections[0].incipits:
+        catalog.sections.pop(0)
+    return catalog
+
+
+RUN_SIZE = 10_000      # pieces stream_catalog holds before spilling to disk
+SPILL_DIR = Path('.cache')
+
+
+def write_run(records:list, spill_dir:Path) -> Path:
+    with tempfile.NamedTemporaryFile('wb', dir=spill_dir, suffix='.run', delete=False) as f:
+        for record in records:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return Path(f.name)
+
+
+def read_run(path:Path) -> Iterator:
+    with path.open('rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def stream_catalog(run_size:int=RUN_SIZE, spill_dir:Path=SPILL_DIR) -> Iterator[tuple]:
+    """ The catalog parse_music would build, as ('section', title) and
+        ('incipit', Incipit) in page order (see Catalog.groups), without
+        ever holding all of it: only one YAML file, `run_size` pieces, and
+        the titles and PK/FK links are kept in memory.
+
+        The YAML files are read one at a time into runs of `run_size`
+        pieces, written to `spill_dir` when there is more than one run.
+        Once every title is known, so is the page order (incipit_order);
+        each run is sorted by it and the runs are merged.  Nothing comes
+        out before the last file is read, as any file may hold the first
+        incipit, but from then on one group is handed over at a time. """
+    titles = {}     # title -> order first seen, as parsed_music's keys
+    pks = set()
+    fk_rows = []    # (title order, seq, fk, book, page), for build_fks
+    seq = 0
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=spill_dir, prefix='spill-') as spill:
+        runs = []
+        buffer = []
+
+        def add(parsed):
+            nonlocal seq, buffer
+            for title, pieces in parsed.items():
+                order = titles.setdefault(title, len(titles))
+                for piece in pieces:
+                    seq += 1
+                    if piece.pk is not None:
+                        pks.add(piece.pk)
+                    if piece.fk is not None:
+                        fk_rows.append((order, seq, piece.fk, piece.book, piece.page))
+                    buffer.append((title, seq, piece))
+            if len(buffer) >= run_size:
+                runs.append(write_run(buffer, Path(spill)))
+                buffer = []
+
+        with metrics.span('yaml_load'):
+            for yaml_path in Path('data').glob('*.yaml'):
+                add(parse_yaml_file(yaml_path))
+            saves = defaultdict(list)
+            entries, _cursor, _reset = SaveLog().read()
+            for entry in entries:
+                parse_one_piece(entry, saves)
+            add(latest_saves(saves))
+            del saves
+
+        incipits = incipit_order(dict.fromkeys(titles))
+        positions = defaultdict(list)
+        for position, k in enumerate(incipits):
+            if not k.startswith('# '):
+                positions[k.removeprefix('=')].append(position)
+        fks = {pk: [] for pk in pks}
+        fk_rows.sort(key=lambda row: row[:2])
+        for _order, _seq, fk, book, page in fk_rows:
+            if fk in fks:
+                fks[fk].append(Source(book, page))
+        del titles, pks, fk_rows
+
+        def by_position(records):
+            return sorted(((position, seq, piece) for title, seq, piece in records
+                           for position in positions[title]), key=lambda r: r[:2])
+        if runs:
+            if buffer:
+                runs.append(write_run(buffer, Path(spill)))
+                buffer = []
+            for i, run in enumerate(runs):
+                runs[i] = write_run(by_position(read_run(run)), Path(spill))
+                run.unlink()
+            merged = heapq.merge(*(read_run(run) for run in runs), key=lambda r: r[:2])
+        else:
+            merged = iter(by_position(buffer))
+            buffer = []
+
+        # the same walk as build_catalog's, a group at a time
+        row = next(merged, None)
+        last_k = ''
+        incipit = None
+        notation_number = 0
+        for position, k in enumerate(incipits):
+            if k.startswith('# ') or not k.startswith('='):
+                if incipit is not None:
+                    yield ('incipit', incipit)
+                incipit = None
+                if k.startswith('# '):
+                    yield ('section', k[2:])
+                    continue
                 last_k = k
-            v = parsed_music[k]
-            for row in v:
-                source = f"<i>{row.book}</i>:{row.page}"
-                if row.pk is not None and row.pk in fks:
-                    for fk_piece in fks.get(row.pk):
-                        source += f"<br/><i>{fk_piece.book}</i>:{fk_piece.page}"
-                # if this row has a FK and it's a key in FKS (thus the PK exists)
-                # then skip it
-                if row.fk is not None and row.fk in fks:
+            while row is not None and row[0] == position:
+                piece = row[2]
+                row = next(merged, None)
+                if piece.fk is not None and piece.fk in fks:
                     continue
-                if row.nb:
-                    source += f"<br>{row.nb}"
-                    # <br/>{fk_piece.nb}"
-                print(last_k, # row.title,
-                      row.composer,
-                      row.abc,
-                      source,
-                      sep='\t', file=o)
+                sources = [Source(piece.book, piece.page)]
+                if piece.pk is not None and piece.pk in fks:
+                    sources.extend(fks[piece.pk])
+                if incipit is None:
+                    incipit = Incipit(title=last_k)
+                notation_number += 1
+                incipit.versions.append(Version(
+                    number = notation_number,
+                    composer = piece.composer,
+                    abc = piece.abc,
+                    sources = sources,
+                    nb = piece.nb,
+                    music_fields = piece.music_fields,
+                ))
+        if incipit is not None:
+            yield ('incipit', incipit)
+
 
+def parse_music(use_cache:bool=True, tsv_path:str|None='x.tsv', workers:int=1) -> Catalog:
+    with metrics.span('yaml_load'):
+        parsed_music = load_parsed_music(use_cache, workers)
+    with metrics.span('catalog_build'):
+        catalog = build_catalog(parsed_music, incipit_order(parsed_music))
+    if tsv_path:
+        with metrics.span('tsv_write'):
+            catalog.write_tsv(tsv_path)
 
     print_counts(parsed_music)
+    print("ABC cache:", abc_cache.stats())
+    return catalog
+
+
+def save_catalog(catalog: Catalog, path) -> None:
+    ''' a snapshot of a built catalog, for another process to load_catalog '''
+    with atomic_open(path, 'wb') as f:
+        pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_catalog(path) -> Catalog:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
 
 if __name__ == '__main__':
-    parse_music()
+    import argparse
+    parser = argparse.ArgumentParser(description="Parse data/*.yaml and saves.json into x.tsv")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="parse YAML files in this many processes (default 1, i.e. serially)")
+    parser.add_argument('--no-cache', action='store_true', help="ignore and don't update .cache/")
+    parser.add_argument('--trace', metavar='PATH', help="write a Chrome trace of the build to PATH")
+    parser.add_argument('--stream', action='store_true',
+                        help="write x.tsv without holding the whole catalog in memory (ignores the caches)")
+    parser.add_argument('--run-size', type=int, default=RUN_SIZE,
+                        help="with --stream, pieces to hold before spilling to .cache/")
+    args = parser.parse_args()
+    with metrics.trace('parse_music') as trace:
+        if args.stream:
+            write_tsv('x.tsv', stream_catalog(args.run_size))
+        else:
+            parse_music(use_cache=not args.no_cache, workers=args.workers)
+    if args.trace:
+        atomic_write_text(args.trace, trace.chrome_json())
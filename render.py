@@ -1,12 +1,15 @@
-''' render my tefillot music tsv into html/svg
+''' render my tefillot music catalog into html/svg
     Andrew M Greene
 '''
 
-import codecs
-import csv
 import datetime
+import html
+import json
 
-from flask import render_template
+from flask import render_template, stream_template
+
+from atomic import atomic_write_text
+from metrics import metrics
 
 def render(music, notation_number):
     ''' Actually, for now, just assume it's valid ABC '''
@@ -17,46 +20,168 @@ def render(music, notation_number):
     return f"<div id='notation{notation_number}'></div><script>make('notation{notation_number}', 'X:{notation_number}\\n{abc}');</script>"
 
 
-def format_music():
-    s = []
-    notation_number = 0
-    incipit = ''
-    for filename in ('x.tsv',): # 'data.tsv'):
-        for row in csv.DictReader(codecs.open(filename, 'r', 'utf-8'), delimiter='\t'):
-            if row['Incipit'].startswith('#'):
-                continue
-            composer = row['Composer']
+def render_lazy(music, notation_number, tunes):
+    ''' Leave an empty placeholder and queue the ABC in `tunes`;
+        the page draws it when it scrolls into view '''
+    tunes[notation_number] = f'X:{notation_number}\n' + music.replace('\\n', '\n')
+    return f"<div id='notation{notation_number}' class='lazy' data-n='{notation_number}'></div>"
+
+
+def midi_link(midi_url):
+    # most browsers save a .mid rather than play it, so Play stays with the
+    # synth and the cached file is offered as a download
+    if not midi_url:
+        return ''
+    return f'<a class="midi" href="{midi_url}" type="audio/midi" download>download MIDI</a>'
+
+
+def audio_cell(notation_number, lazy, midi_url=None):
+    if lazy:
+        return (f'<td><br><div style="width: 200px" id="notation{notation_number}a">'
+                f'<button class="play" onclick="play({notation_number})">&#9654; Play</button></div>'
+                f'{midi_link(midi_url)}</td>')
+    return f'<td><br><div style="width: 200px" id="notation{notation_number}a" />{midi_link(midi_url)}</td>'
+
+
+def tunes_payload(tunes):
+    # keep "</script>" in a lyric from closing the payload early
+    return json.dumps(tunes, ensure_ascii=False).replace('</', '<\\/')
+
+
+def key_attr(key):
+    return f' data-key="{html.escape(key)}"' if key is not None else ''
 
-            # This is how we do section headers
-            if composer is None:
-                s.append(f'<tr class="section"><td colspan=4>{row["Incipit"]}</td></tr>')
-                continue
 
-            if incipit != row["Incipit"]:
-                incipit = row["Incipit"]
-                s.append(f'<tr class="incipit"><td colspan=4>{row["Incipit"]}</td></tr>')
+def version_row(version, lazy, tunes, notation_number, midi_url=None, key=None):
+    composer = version.composer
+    if composer.startswith('.'):
+        composer = composer[1:]
 
-            if composer.startswith('.'):
-                composer = composer[1:]
+    style = 'x' if 'Carlebach' in composer else ''
 
-            style = 'x' if 'Carlebach' in composer else ''
-            notation_number += 1
+    if lazy:
+        notation = render_lazy(version.abc, notation_number, tunes)
+    else:
+        notation = render(version.abc, notation_number)
 
-            s.append(''.join([
-                f'<tr valign="top"><td>',
-                f'<td><br><div style="width: 200px" id="notation{notation_number}a" /></td>',
-                f'<td class="{style}">{render(row["Music"], notation_number)}</td>',
-                f'<td><br><b>{composer}</b><br/>{row["Source"]}</td></tr>',
-            ]))
+    return ''.join([
+        f'<tr valign="top"{key_attr(key)}><td>',
+        audio_cell(notation_number, lazy, midi_url),
+        f'<td class="{style}">{notation}</td>',
+        f'<td><br><b>{composer}</b><br/>{version.source_html()}</td></tr>',
+    ])
+
+
+def section_row(title, key=None):
+    return f'<tr class="section"{key_attr(key)}><td colspan=4>{title}</td></tr>'
+
+
+def incipit_row(title, anchor, key=None):
+    return f'<tr class="incipit" id="{anchor}"{key_attr(key)}><td colspan=4>{title}</td></tr>'
+
+
+def row_keys(catalog):
+    ''' {id(section, incipit or version): key}: keys that identify a row
+        across edits, whatever its position or notation number '''
+    keys = {}
+    seen = set()
+
+    def unique(key):
+        n = 1
+        candidate = key
+        while candidate in seen:
+            n += 1
+            candidate = f'{key}#{n}'
+        seen.add(candidate)
+        return candidate
+
+    for section in catalog.sections:
+        keys[id(section)] = unique(f's:{section.title}')
+        for incipit in section.incipits:
+            keys[id(incipit)] = unique(f'i:{incipit.title}')
+            for version in incipit.versions:
+                source = version.sources[0] if version.sources else None
+                keys[id(version)] = unique(
+                    f'v:{incipit.title}|{source.book if source else ""}|{source.page if source else ""}')
+    return keys
+
+
+def section_rows(section, lazy, tunes, local_numbers=False, anchors=None, midi=None, keys=None):
+    ''' local_numbers numbers the notations from 1 within the section, so
+        a page of just this section doesn't change when pieces are added
+        elsewhere; each incipit row gets an id, which is also recorded in
+        `anchors` (title -> id) when given.  `midi` maps version numbers
+        to the URLs of their MIDI files; `keys` (from row_keys) adds a
+        data-key to every row. '''
+    keys = keys or {}
+    s = []
+    if section.title is not None:
+        s.append(section_row(section.title, keys.get(id(section))))
+    local = 0
+    for incipit in section.incipits:
+        numbers = []
+        for version in incipit.versions:
+            local += 1
+            numbers.append(local if local_numbers else version.number)
+        if anchors is not None:
+            anchors[incipit.title] = f'i{numbers[0]}'
+        s.extend(incipit_rows(incipit, lazy, tunes, numbers, midi, keys))
+    return s
+
+
+def incipit_rows(incipit, lazy, tunes, numbers, midi=None, keys=None):
+    ''' the incipit's own row and one per version, numbered `numbers` '''
+    midi = midi or {}
+    keys = keys or {}
+    return [incipit_row(incipit.title, f'i{numbers[0]}', keys.get(id(incipit)))] + [
+        version_row(version, lazy, tunes, n, midi.get(version.number), keys.get(id(version)))
+        for version, n in zip(incipit.versions, numbers)]
+
+
+def format_music(catalog, lazy=True, midi=None, live=None):
+    ''' lazy=True only ships the ABC as one JSON payload and lets the page
+        engrave each staff (and build its synth) on demand; lazy=False
+        renders everything on load, as before.  `midi` is as for
+        section_rows.  With `live` (a watch.CatalogWatcher generation) the
+        rows are keyed and the page follows the watcher's updates. '''
+    tunes = {}
+    keys = row_keys(catalog) if live is not None else None
+    s = [row for section in catalog.sections
+         for row in section_rows(section, lazy, tunes, midi=midi, keys=keys)]
 
     data = {
         'table_body': '\n'.join(s),
+        'tunes': tunes_payload(tunes),
+        'lazy': lazy,
+        'live': live,
         'datetime': datetime,
     }
     rendered = render_template('main.html', **data)
 
-    with codecs.open('index.html', 'w', 'utf-8') as fout:
-        print(rendered, file=fout)
+    atomic_write_text('index.html', rendered + '\n')
+    metrics.inc('tefillot_bytes_written_total', len(rendered.encode('utf-8')) + 1, output='index.html')
+    return rendered
+
+
+def stream_music(groups, lazy=True, midi_url=None):
+    ''' format_music for a catalog that is never all in memory: `groups`
+        as from parse.stream_catalog (or Catalog.groups), rendered and sent
+        an incipit at a time, each followed by the ABC for its staves.
+        midi_url(version) gives the link for a version's MIDI file.  For a
+        Flask response; nothing is written to index.html. '''
+    def rows():
+        for kind, item in groups:
+            if kind == 'section':
+                yield section_row(item) + '\n'
+                continue
+            tunes = {}
+            midi = {v.number: midi_url(v) for v in item.versions} if midi_url else None
+            s = incipit_rows(item, lazy, tunes, [v.number for v in item.versions], midi)
+            if lazy:
+                s.append(f'<script>addTunes({tunes_payload(tunes)});</script>')
+            yield '\n'.join(s) + '\n'
+
+    return stream_template('main.html', rows=rows(), tunes=None, lazy=lazy, live=None, datetime=datetime)
 
 
 '''
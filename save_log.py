@@ -0,0 +1,186 @@
+''' the append-only log of pieces saved from the /abc editor (saves.json)
+
+    One JSON object per line.  Appends are validated first, serialised
+    across threads and processes with a lock file, written with a single
+    write() and fsync'ed, so concurrent editors can't interleave or tear
+    lines.  A line torn by a crash is skipped (with a warning) by readers
+    and fenced off by the next append.
+
+    A later save of the same title/book/page replaces the earlier one;
+    compact() drops the superseded lines.  read(cursor) returns only what
+    was appended since the cursor, so a running server can fold new saves
+    in without re-reading the log.
+'''
+
+from contextlib import contextmanager
+import datetime
+import json
+import os
+from pathlib import Path
+import re
+from typing import NamedTuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from atomic import atomic_open
+from metrics import metrics
+from tokenizer import notes_errors
+
+SAVES_PATH = Path('saves.json')
+FIELDS = ('time', 'key', 'notes', 'lyrics', 'book', 'page', 'title', 'composer', 'nb')
+REQUIRED = ('title', 'book', 'page', 'time', 'key', 'notes')
+TIME_RE = re.compile(r'\d+/\d+')
+
+
+class SaveError(ValueError):
+    def __init__(self, errors: list[str]):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+class Cursor(NamedTuple):
+    file_id: tuple  # (st_dev, st_ino); changes when compact() replaces the file
+    offset: int     # just past the last complete line read
+
+
+def entry_key(entry: dict) -> tuple:
+    return (entry.get('title'), entry.get('book'), entry.get('page'))
+
+
+def validate_entry(entry: dict) -> list[str]:
+    errors = [f"{k} is required" for k in REQUIRED if not entry.get(k)]
+    errors.extend(f"{k} must be a string" for k, v in entry.items()
+                  if v is not None and not isinstance(v, str))
+    if errors:
+        return errors
+    if not TIME_RE.fullmatch(entry['time']):
+        errors.append(f"time should be a fraction such as 4/4, not {entry['time']!r}")
+    errors.extend(str(e) for e in notes_errors(entry['notes']))
+    return errors
+
+
+def parse_line(line: str | bytes) -> dict | None:
+    ''' one log line, or None (with a warning) if it is torn or garbled '''
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        entry = None
+    if not isinstance(entry, dict) or 'title' not in entry:
+        print(f"saves.json: skipping unreadable line {line[:60]!r}")
+        return None
+    return entry
+
+
+def latest(entries: list[dict]) -> list[dict]:
+    ''' the last entry for each title/book/page, in the order they were last saved '''
+    by_key = {}
+    for entry in entries:
+        by_key.pop(entry_key(entry), None)
+        by_key[entry_key(entry)] = entry
+    return list(by_key.values())
+
+
+class SaveLog:
+    def __init__(self, path: Path = SAVES_PATH):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self.appended = 0
+
+    @contextmanager
+    def locked(self):
+        with open(self.lock_path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def append(self, entry: dict) -> dict:
+        ''' validate, timestamp and durably append one entry; raises SaveError '''
+        errors = validate_entry(entry)
+        if errors:
+            metrics.inc('tefillot_saves_total', outcome='rejected')
+            raise SaveError(errors)
+        entry = dict(entry, timestamp=datetime.datetime.now(tz=datetime.timezone.utc).isoformat())
+        line = json.dumps(entry).encode('utf-8') + b'\n'
+        with self.locked():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+            try:
+                size = os.fstat(fd).st_size
+                if size and self._last_byte() != b'\n':
+                    # a crash tore the previous line; start ours on a fresh one
+                    line = b'\n' + line
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.appended += 1
+        metrics.inc('tefillot_saves_total', outcome='saved')
+        metrics.inc('tefillot_bytes_written_total', len(line), output='saves.json')
+        return entry
+
+    def _last_byte(self) -> bytes:
+        with self.path.open('rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1)
+
+    def read(self, cursor: Cursor | None = None) -> tuple[list[dict], Cursor, bool]:
+        ''' (entries appended since `cursor`, new cursor, reset); reset is
+            True when the whole log was read again, e.g. after compaction,
+            and the caller should drop what it folded in before '''
+        try:
+            f = self.path.open('rb')
+        except FileNotFoundError:
+            return [], Cursor((), 0), cursor is not None and cursor.offset > 0
+        with f:
+            st = os.fstat(f.fileno())
+            file_id = (st.st_dev, st.st_ino)
+            reset = cursor is None or cursor.file_id != file_id or cursor.offset > st.st_size
+            offset = 0 if reset else cursor.offset
+            f.seek(offset)
+            data = f.read()
+        # a partial last line is left for the next read
+        end = data.rfind(b'\n') + 1
+        entries = [entry for line in data[:end].splitlines() if line.strip()
+                   for entry in [parse_line(line)] if entry is not None]
+        return entries, Cursor(file_id, offset + end), reset
+
+    def compact(self) -> tuple[int, int]:
+        ''' rewrite the log keeping only the latest entry per
+            title/book/page; returns (lines before, lines after) '''
+        with metrics.span('save_compact'), self.locked():
+            entries, _cursor, _reset = self.read()
+            kept = latest(entries)
+            with atomic_open(self.path, 'w') as f:
+                for entry in kept:
+                    print(json.dumps(entry), file=f)
+                f.flush()
+                os.fsync(f.fileno())
+        return len(entries), len(kept)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Maintain saves.json")
+    parser.add_argument('--compact', action='store_true',
+                        help="drop entries superseded by a later save of the same title/book/page")
+    args = parser.parse_args()
+    log = SaveLog()
+    if args.compact:
+        before, after = log.compact()
+        print(f"{before} entries, {after} kept")
+    else:
+        entries, _cursor, _reset = log.read()
+        print(f"{len(entries)} entries, {len(latest(entries))} current")
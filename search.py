@@ -0,0 +1,178 @@
+''' find a tune from a few remembered notes
+
+    Every version's note list is reduced to its pitches (in semitones,
+    with the key signature and accidentals carried through the measure
+    applied) and note lengths, and from those to n-grams of
+    - intervals between successive notes, so a query sung in any key matches;
+    - ratios between successive note lengths, so it doesn't matter
+      whether the tune was written in quarters or eighths.
+    An inverted index maps each n-gram to the versions containing it, so
+    a query only touches the postings of its own n-grams, never the
+    whole catalog.  Rare and longer n-grams count for more.
+
+    The per-piece features are cached in .cache/search.pickle, keyed like
+    the ABC cache, so rebuilding the index only parses new or edited pieces.
+'''
+
+from collections import defaultdict
+from fractions import Fraction
+import math
+import hashlib
+from pathlib import Path
+import pickle
+
+from abc_cache import piece_key
+from atomic import atomic_open
+from catalog import Catalog
+from parse import MusicState, code_hash
+from theory import duration_fraction, midi_pitches
+
+FEATURE_CACHE_PATH = Path('.cache/search.pickle')
+FEATURE_CACHE_VERSION = 2
+
+INTERVAL_NS = (2, 3, 4)   # intervals per n-gram
+RHYTHM_NS = (2, 3)        # length ratios per n-gram
+RHYTHM_WEIGHT = 0.5
+# n-grams found in more than this share of versions (say, two repeated
+# notes) are only consulted when the query has nothing rarer
+COMMON_FRACTION = 0.25
+
+
+def pitches_and_durations(music, key) -> tuple[tuple[int, ...], tuple[Fraction, ...]]:
+    ''' rests are skipped '''
+    sounding = [(pitch, duration_fraction(note.duration))
+                for note, pitch in zip(music, midi_pitches(music, key)) if pitch is not None]
+    return tuple(p for p, _ in sounding), tuple(d for _, d in sounding)
+
+
+def ngrams(pitches, durations) -> set[str]:
+    intervals = [str(b - a) for a, b in zip(pitches, pitches[1:])]
+    ratios = [str(b / a) for a, b in zip(durations, durations[1:])]
+    grams = set()
+    for n in INTERVAL_NS:
+        grams.update('i' + ','.join(intervals[i:i + n]) for i in range(len(intervals) - n + 1))
+    for n in RHYTHM_NS:
+        grams.update('r' + ','.join(ratios[i:i + n]) for i in range(len(ratios) - n + 1))
+    return grams
+
+
+def gram_weight(gram: str) -> float:
+    n = gram.count(',') + 1
+    return n * RHYTHM_WEIGHT if gram[0] == 'r' else n
+
+
+class SearchIndex:
+    def __init__(self):
+        self.postings: dict[str, list[int]] = defaultdict(list)
+        self.docs: list[tuple[int, str, str]] = []  # (notation number, incipit, composer)
+
+    def add(self, number: int, title: str, composer: str, grams: set[str]) -> None:
+        doc = len(self.docs)
+        self.docs.append((number, title, composer))
+        for gram in grams:
+            self.postings[gram].append(doc)
+
+    def search(self, grams: set[str], rhythm: bool = True, limit: int = 20) -> list[dict]:
+        ''' incipits ranked by their best-matching version '''
+        if not rhythm:
+            grams = {g for g in grams if g[0] != 'r'}
+        present = sorted((g for g in grams if g in self.postings), key=lambda g: len(self.postings[g]))
+        common = len(self.docs) * COMMON_FRACTION
+        rare = [g for g in present if len(self.postings[g]) <= common]
+        scores = defaultdict(float)
+        for gram in rare or present:
+            docs = self.postings[gram]
+            weight = gram_weight(gram) * math.log(1 + len(self.docs) / len(docs))
+            for doc in docs:
+                scores[doc] += weight
+
+        incipits = {}
+        for doc, score in sorted(scores.items(), key=lambda item: -item[1]):
+            number, title, composer = self.docs[doc]
+            entry = incipits.setdefault(title, {'title': title, 'score': round(score, 3), 'versions': []})
+            entry['versions'].append({'number': number, 'composer': composer, 'score': round(score, 3)})
+            if len(incipits) > limit:
+                del incipits[title]
+                break
+        return list(incipits.values())
+
+
+def feature_salt() -> str:
+    # the features come from the parser and from this module
+    return code_hash() + hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, path: Path = FEATURE_CACHE_PATH, salt: str = ''):
+        self.path = Path(path)
+        self.salt = salt
+        self.features: dict[str, tuple] = {}
+        self.used: set[str] = set()
+        self.dirty = False
+        try:
+            with self.path.open('rb') as f:
+                stored = pickle.load(f)
+            if stored.get('version') == FEATURE_CACHE_VERSION and stored.get('salt') == salt:
+                self.features = stored['features']
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+    def features_for(self, music_fields: dict) -> tuple:
+        key = piece_key(music_fields, self.salt)
+        self.used.add(key)
+        found = self.features.get(key)
+        if found is None:
+            music = MusicState(dict(music_fields)).music
+            found = self.features[key] = pitches_and_durations(music, music_fields.get('key'))
+            self.dirty = True
+        return found
+
+    def save(self) -> None:
+        ''' write back the features used since loading; edited-away pieces are dropped '''
+        if not self.dirty and len(self.used) == len(self.features):
+            return
+        self.features = {k: v for k, v in self.features.items() if k in self.used}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_open(self.path, 'wb') as f:
+            pickle.dump({'version': FEATURE_CACHE_VERSION,
+                         'salt': self.salt,
+                         'features': self.features}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.dirty = False
+
+
+def index_catalog(catalog: Catalog, feature_cache: FeatureCache | None = None) -> SearchIndex:
+    feature_cache = feature_cache or FeatureCache(salt=feature_salt())
+    index = SearchIndex()
+    for section in catalog.sections:
+        for incipit in section.incipits:
+            for version in incipit.versions:
+                if not version.music_fields:
+                    continue
+                pitches, durations = feature_cache.features_for(version.music_fields)
+                index.add(version.number, incipit.title, version.composer, ngrams(pitches, durations))
+    feature_cache.save()
+    return index
+
+
+def query_grams(notes: str, key: str = 'C') -> tuple[set[str], list]:
+    ''' n-grams of a query in our notes syntax, plus any notation errors '''
+    state = MusicState({'title': 'query', 'notes': notes, 'key': key, 'time': '4/4'})
+    return ngrams(*pitches_and_durations(state.music, key)), state.diagnostics
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import time
+    from parse import parse_music
+    parser = argparse.ArgumentParser(description="Look up incipits from a few notes, e.g. 'd4 e f g a'")
+    parser.add_argument('notes')
+    parser.add_argument('--key', default='C')
+    parser.add_argument('--no-rhythm', action='store_true', help="match intervals only")
+    args = parser.parse_args()
+    index = index_catalog(parse_music(tsv_path=None))
+    start = time.perf_counter()
+    grams, errors = query_grams(args.notes, args.key)
+    hits = index.search(grams, rhythm=not args.no_rhythm)
+    print(json.dumps(hits, indent=1, ensure_ascii=False))
+    print(f"{len(index.docs)} versions, {len(index.postings)} n-grams, query took {1000 * (time.perf_counter() - start):.2f} ms")
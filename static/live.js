@@ -0,0 +1,66 @@
+// Watch mode (app.py --watch): the server pushes the rows that changed
+// since the generation this page was rendered at.  Each pushed row comes
+// with its own notation number and ABC; only those staves are engraved.
+// Unchanged rows, and the staves already drawn in them, are kept.
+function showProblems(errors) {
+    var banner = document.getElementById('problems');
+    if (!banner) {
+        banner = document.createElement('pre');
+        banner.id = 'problems';
+        banner.style.cssText = 'position: fixed; top: 0; left: 0; right: 0; margin: 0; padding: 0.5em; background: #fdd; z-index: 1';
+        document.body.appendChild(banner);
+    }
+    banner.textContent = errors.join('\n');
+    banner.hidden = errors.length == 0;
+}
+function applyRows(update) {
+    var payload = document.getElementById('tunes');
+    if (tunes === null)
+        tunes = payload ? JSON.parse(payload.textContent) : {};
+    Object.assign(tunes, update.tunes);
+
+    var byKey = {};
+    document.querySelectorAll('tr[data-key]').forEach(function (tr) { byKey[tr.dataset.key] = tr; });
+    // a page with no rows yet still has the table's (implicit) tbody
+    var first = document.querySelector('tr[data-key]');
+    var tbody = first ? first.parentNode : document.querySelector('table tbody');
+    var fresh = [];
+    Object.keys(update.rows).forEach(function (key) {
+        var holder = document.createElement('tbody');
+        holder.innerHTML = update.rows[key];
+        var tr = holder.firstElementChild;
+        if (byKey[key] && !update.order)
+            tbody.replaceChild(tr, byKey[key]);
+        byKey[key] = tr;
+        fresh.push(tr);
+    });
+    if (update.order) {
+        // appendChild moves a row, with its drawn staff, rather than copying it
+        tbody.querySelectorAll('tr[data-key]').forEach(function (tr) { tr.remove(); });
+        update.order.forEach(function (key) { tbody.appendChild(byKey[key]); });
+    }
+    fresh.forEach(function (tr) {
+        tr.querySelectorAll('div.lazy').forEach(function (el) { draw(+el.dataset.n); });
+    });
+    showProblems([]);
+}
+function watchLive(generation) {
+    var events = new EventSource('events?generation=' + generation);
+    events.addEventListener('reload', function () {
+        events.close();
+        location.reload();
+    });
+    events.addEventListener('rows', function (e) {
+        var update = JSON.parse(e.data);
+        if (update.from !== generation) {
+            events.close();
+            location.reload();
+            return;
+        }
+        generation = update.to;
+        applyRows(update);
+    });
+    events.addEventListener('problem', function (e) {
+        showProblems(JSON.parse(e.data).errors);
+    });
+}
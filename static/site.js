@@ -0,0 +1,37 @@
+// Search for the static site's index page: the payload (one
+// [title, composers, url] per incipit) is only fetched on first use.
+var entries = null;
+function search(q) {
+    var results = document.getElementById('results');
+    results.innerHTML = '';
+    q = q.trim().toLowerCase();
+    if (!q)
+        return;
+    var shown = 0;
+    for (var i = 0; i < entries.length && shown < 50; i++) {
+        var e = entries[i];
+        if (e[0].toLowerCase().indexOf(q) < 0 && e[1].toLowerCase().indexOf(q) < 0)
+            continue;
+        var li = document.createElement('li');
+        var a = document.createElement('a');
+        a.href = e[2];
+        a.textContent = e[0];
+        li.appendChild(a);
+        li.appendChild(document.createTextNode(' - ' + e[1]));
+        results.appendChild(li);
+        shown++;
+    }
+}
+function watchSearch() {
+    var input = document.getElementById('q');
+    input.addEventListener('input', function () {
+        if (entries !== null) {
+            search(input.value);
+            return;
+        }
+        fetch(input.dataset.payload).then(function (r) { return r.json(); }).then(function (data) {
+            entries = data;
+            search(input.value);
+        });
+    });
+}
@@ -0,0 +1,52 @@
+function make(id, abc) {
+    var visualObj = ABCJS.renderAbc(id, abc)[0];
+    var synthControl = new ABCJS.synth.SynthController();
+    synthControl.load('#' + id + "a", null, {displayRestart: true, displayPlay: true, displayProgress: true});
+    synthControl.setTune(visualObj, false);
+}
+
+// Lazy mode: the ABC for every row lives in the #tunes payload (by
+// notation number); each
+// staff is engraved when it comes near the viewport, and its synth is
+// only built when someone presses play.
+var tunes = null;
+var drawn = {};
+function tune(n) {
+    if (tunes === null)
+        tunes = JSON.parse(document.getElementById('tunes').textContent);
+    return tunes[n];
+}
+// a streamed page sends the ABC a group at a time, after its rows
+function addTunes(more) {
+    tunes = Object.assign(tunes || {}, more);
+}
+function draw(n) {
+    if (!drawn[n])
+        drawn[n] = ABCJS.renderAbc('notation' + n, tune(n))[0];
+    return drawn[n];
+}
+function play(n) {
+    var visualObj = draw(n);
+    var synthControl = new ABCJS.synth.SynthController();
+    synthControl.load('#notation' + n + 'a', null, {displayRestart: true, displayPlay: true, displayProgress: true});
+    synthControl.setTune(visualObj, true).then(function () { synthControl.play(); });
+}
+function drawAll() {
+    document.querySelectorAll('div.lazy').forEach(function (el) { draw(+el.dataset.n); });
+}
+function watchLazy() {
+    var placeholders = document.querySelectorAll('div.lazy');
+    if (!('IntersectionObserver' in window)) {
+        drawAll();
+        return;
+    }
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                draw(+entry.target.dataset.n);
+                observer.unobserve(entry.target);
+            }
+        });
+    }, {rootMargin: '800px 0px'});
+    placeholders.forEach(function (el) { observer.observe(el); });
+}
@@ -1,20 +1,21 @@
-import codecs
-import csv
 import datetime
+import hashlib
+import pickle
 
 from pathlib import Path
 
-from reportlab.graphics import renderPDF, renderPM
-from reportlab.graphics.shapes import Drawing, Group, Rect, Path as ShapePath
+from reportlab.graphics.shapes import Drawing, Group, Rect
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import Flowable
 # from reportlab.platypus import SimpleDocTemplate, Paragraph
 from reportlab.platypus import BaseDocTemplate, Frame, Paragraph, PageBreak, PageTemplate, KeepTogether, CondPageBreak
 
-from svglib.svglib import svg2rlg
+from atomic import atomic_open
+from parse import parse_music
 
-from bs4 import BeautifulSoup
+DRAWING_CACHE_DIR = Path('.cache/drawings')
+DRAWING_CACHE_VERSION = 1
+SCALE = 0.33
 
 def recursivelyRed(group):
     if isinstance(group, Group):
@@ -36,11 +37,13 @@ def recursivelyRed(group):
 
 
 def svg(p:Path):
+    # svglib (and lxml behind it) is only needed when an SVG isn't cached yet
+    from svglib.svglib import svg2rlg
     drawing = svg2rlg(p.open(encoding='utf8'))
     if drawing is None:
         return None
     # Scale the Drawing.
-    scale = 0.33
+    scale = SCALE
     drawing.scale(scale, scale)
     drawing.width *= scale
     drawing.height *= scale
@@ -48,6 +51,59 @@ def svg(p:Path):
     return drawing
 
 
+def drawing_cache_path(svg_bytes:bytes, red:bool) -> Path:
+    variant = f'{DRAWING_CACHE_VERSION}:{SCALE}:{"red" if red else "plain"}:'
+    key = hashlib.sha256(variant.encode('utf-8') + svg_bytes).hexdigest()
+    return DRAWING_CACHE_DIR / key[:2] / f'{key}.pickle'
+
+
+def convert_svg(job:tuple[str, bool, str]) -> bytes:
+    ''' svg2rlg + scaling (+ recolouring), pickled and stored under the
+        cache path; runs in a worker process '''
+    svg_path, red, cache_path = job
+    drawing = svg(Path(svg_path))
+    if drawing is not None and red:
+        recursivelyRed(drawing.contents)
+    data = pickle.dumps(drawing, protocol=pickle.HIGHEST_PROTOCOL)
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_open(cache_path, 'wb') as f:
+        f.write(data)
+    return data
+
+
+def load_drawings(versions, workers:int=1) -> dict[int, Drawing]:
+    ''' {notation number: Drawing}; only SVGs whose content (or style
+        variant) is new since the last build are converted '''
+    drawings = {}
+    jobs = []
+    numbers = []
+    for version in versions:
+        svg_path = Path(f'Images/notation{version.number}.svg')
+        try:
+            svg_bytes = svg_path.read_bytes()
+        except FileNotFoundError:
+            continue
+        red = 'Carlebach' in version.composer
+        cache_path = drawing_cache_path(svg_bytes, red)
+        try:
+            drawings[version.number] = pickle.loads(cache_path.read_bytes())
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+            jobs.append((str(svg_path), red, str(cache_path)))
+            numbers.append(version.number)
+
+    print(f"Drawings: {len(drawings)} cached, {len(jobs)} to convert")
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            converted = list(pool.map(convert_svg, jobs, chunksize=8))
+    else:
+        converted = [convert_svg(job) for job in jobs]
+    for number, data in zip(numbers, converted):
+        drawings[number] = pickle.loads(data)
+    return drawings
+
+
 INCIPIT_STYLE = ParagraphStyle(
     'incipit',
     fontSize = 12,
@@ -61,7 +117,7 @@ RED = ParagraphStyle(
 
 # print(getSampleStyleSheet().byName.keys())
 
-def get_doc(pdf_path):
+def get_doc(pdf_path, page_numbers=True):
     doc = BaseDocTemplate(pdf_path,
                           pageSize=letter,
                           leftMargin = 24,
@@ -77,7 +133,7 @@ def get_doc(pdf_path):
     # Elements.append(Paragraph(" ".join([random.choice(words) for i in range(1000)]),styles['Normal']))
     template = PageTemplate(id='TwoCol',
                             frames=[frame1,frame2],
-                            onPageEnd=addPageNumbers,
+                            **({'onPageEnd': addPageNumbers} if page_numbers else {}),
                             )
     doc.addPageTemplates([template, ])
 
@@ -100,31 +156,27 @@ def boilerplate(story):
             Paragraph("""Feedback to <a href="mailto:andrew@greenehouse.com">andrew@greenehouse.com</a>""")
             ])
 
-def example(content):
+def story_for(entries, drawings:dict[int, Drawing]) -> list:
     styles = getSampleStyleSheet()
-    pdf_path = 'tefilot.pdf'
-
     story = []
-    boilerplate(story)
-
     keep_together = []
-    for row in content:
+    for row in entries:
         if row[0] == 'notation':
-            drawing = svg(Path(f'Images/notation{row[1]}.svg'))
+            version = row[1]
+            drawing = drawings.get(version.number)
             if drawing is None:
                 continue
-            if 'Carlebach' in row[2]:
+            if 'Carlebach' in version.composer:
                 style = RED
-                # print('----')
-                recursivelyRed(drawing.contents)
+                # already recoloured by recursivelyRed in convert_svg
             else:
                 style = styles['Normal']
 
-            composer = row[2]
+            composer = version.composer
             if composer.startswith('.'):
                 composer = composer[1:]
 
-            source = row[3].replace('<br>', '<br/>').split("<br/>")
+            source = version.source_lines()
 
             keep_together.extend([
                 Paragraph('<b>' + composer.replace('<br>', '<br/>') + '</b>', style),
@@ -145,6 +197,16 @@ def example(content):
                 CondPageBreak(144),
                 Paragraph(row[1], styles['Heading1']),
                 ])
+    return story
+
+
+def example(catalog, workers=1):
+    pdf_path = 'tefilot.pdf'
+    drawings = load_drawings(catalog.versions(), workers)
+
+    story = []
+    boilerplate(story)
+    story.extend(story_for(catalog.entries(), drawings))
 
     doc = get_doc(pdf_path)
     #doc = SimpleDocTemplate(pdf_path,
@@ -157,33 +219,10 @@ def example(content):
 #    renderPDF.drawToFile(drawing, str(p).replace('.svg', '.pdf'))
 # renderPM.drawToFile(drawing, "Images/notation2.png", fmt="PNG")
 
-h = BeautifulSoup(open('expanded.html'), 'html.parser')
-
-def parse_tsv():
-    content = []
-    incipit = ''
-    notation_number = 0
-
-    for filename in ('x.tsv',): # 'data.tsv'):
-        for row in csv.DictReader(codecs.open(filename, 'r', 'utf-8'), delimiter='\t'):
-            if row['Incipit'].startswith('#'):
-                continue
-            composer = row['Composer']
-
-            # This is how we do section headers
-            if composer is None:
-                content.append(('section', row["Incipit"]))
-                continue
-
-            if incipit != row["Incipit"]:
-                incipit = row["Incipit"]
-                content.append(('incipit', row["Incipit"]))
-
-            style = 'x' if 'Carlebach' in composer else ''
-            notation_number += 1
-            content.append(('notation', notation_number,
-                            composer, row['Source']))
-
-    return content
-
-example(parse_tsv())
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Build tefilot.pdf from the catalog and Images/*.svg")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="convert changed SVGs in this many processes")
+    args = parser.parse_args()
+    example(parse_music(tsv_path=None), workers=args.workers)
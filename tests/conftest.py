@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    ''' an empty checkout to build in: data/, incipits.txt and saves.json
+        are read (and .cache/ written) relative to the current directory '''
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'incipits.txt').write_text('', encoding='utf-8')
+    (tmp_path / 'saves.json').write_text('', encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
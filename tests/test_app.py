@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from app import app
+
+GOOD = {'notes': 'c4 d4 e4 f4', 'lyrics': 'A-don o-lam', 'key': 'C', 'time': '4/4'}
+BAD_NOTES = dict(GOOD, notes='c4 d4 x4')
+BROKEN = dict(GOOD, notes=5)
+
+
+@pytest.fixture
+def client(workdir):
+    return app.test_client()
+
+
+def check_batch(results):
+    good, bad_notes, broken, not_a_piece, good_again = results
+    assert good['diagnostics'] == [] and 'K:C' in good['abc']
+    assert [d['text'] for d in bad_notes['diagnostics']] == ['x', '4']
+    assert bad_notes['diagnostics'][0]['message'] == "unrecognised notes input 'x' at measure 1, column 7"
+    assert list(broken) == ['error'] and list(not_a_piece) == ['error']
+    assert good_again == good
+
+
+def test_one_bad_piece_does_not_sink_the_batch(client):
+    response = client.post('/abc/batch', json=[GOOD, BAD_NOTES, BROKEN, 'c4 d4', GOOD])
+    assert response.status_code == 200
+    check_batch(response.get_json())
+
+
+def test_streamed_batch_isolates_errors_too(client):
+    response = client.post('/abc/batch?stream=1', json=[GOOD, BAD_NOTES, BROKEN, 'c4 d4', GOOD])
+    assert response.mimetype == 'application/x-ndjson'
+    check_batch([json.loads(line) for line in response.get_data(as_text=True).splitlines()])
+
+
+def test_batch_wants_an_array(client):
+    response = client.post('/abc/batch', json={'notes': 'c4'})
+    assert response.status_code == 400
+
+
+def test_a_save_without_a_composer_still_renders(client, monkeypatch):
+    # Templates/ is capitalised, which Flask doesn't look for by default
+    monkeypatch.setattr(app, 'template_folder', 'Templates')
+    monkeypatch.delitem(app.__dict__, 'jinja_loader', raising=False)
+    response = client.get('/abc', query_string=dict(
+        GOOD, title='Adon Olam', book='Siddur', page='1', save='1'))
+    assert b'Saved to disk' in response.data
+
+    for url in ('/', '/?stream=1'):
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        assert '<b>?</b>' in page
+        # Play is the in-page synth; the cached MIDI file is only a download
+        assert 'onclick="play(' in page and '.mid" type="audio/midi" download>' in page
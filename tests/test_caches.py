@@ -0,0 +1,52 @@
+import shutil
+from pathlib import Path
+
+import parse
+from abc_cache import AbcCache
+from catalog_cache import CatalogCache
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def code_hash_of(tmp_path, monkeypatch):
+    # code_hash is cached for the process; call the function underneath it
+    # on copies of the modules
+    monkeypatch.setattr(parse, '__file__', str(tmp_path / 'parse.py'))
+    return parse.code_hash.__wrapped__()
+
+
+def test_code_hash_covers_every_module_the_parser_uses(tmp_path, monkeypatch):
+    for name in parse.CODE_MODULES:
+        shutil.copy(REPO / name, tmp_path / name)
+    seen = {code_hash_of(tmp_path, monkeypatch)}
+    for name in parse.CODE_MODULES:
+        with open(tmp_path / name, 'a', encoding='utf-8') as f:
+            f.write('\n# edited\n')
+        seen.add(code_hash_of(tmp_path, monkeypatch))
+    assert len(seen) == len(parse.CODE_MODULES) + 1
+
+
+def test_abc_cache_misses_after_the_code_changes(tmp_path):
+    calls = []
+
+    def convert(piece):
+        calls.append(piece)
+        return 'abc'
+
+    AbcCache(convert, salt='old', cache_dir=tmp_path).abc_for({'notes': 'c4'})
+    AbcCache(convert, salt='old', cache_dir=tmp_path).abc_for({'notes': 'c4'})
+    assert len(calls) == 1
+    AbcCache(convert, salt='new', cache_dir=tmp_path).abc_for({'notes': 'c4'})
+    assert len(calls) == 2
+
+
+def test_catalog_cache_is_dropped_after_the_code_changes(tmp_path):
+    source = tmp_path / 'a.yaml'
+    source.write_text('Music: []\n', encoding='utf-8')
+    path = tmp_path / 'catalog.pickle'
+    cache = CatalogCache(path, code_hash='old')
+    cache.pieces_for_file(source, lambda p, parsed: None, parse.ParsedPiece)
+    cache.save()
+
+    assert CatalogCache(path, code_hash='old').entries
+    assert not CatalogCache(path, code_hash='new').entries
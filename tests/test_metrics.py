@@ -0,0 +1,15 @@
+from metrics import Metrics
+
+
+def test_a_big_counter_renders_every_digit():
+    m = Metrics()
+    m.inc('tefillot_bytes_written_total', 1234567, output='index.html')
+    assert 'tefillot_bytes_written_total{output="index.html"} 1234567\n' in m.render()
+
+
+def test_collected_floats_keep_full_precision():
+    m = Metrics()
+    m.register_collector(lambda: [('tefillot_ratio', 'gauge', {}, 1234567.125), ('tefillot_count', 'gauge', {}, 7)])
+    rendered = m.render()
+    assert 'tefillot_ratio 1234567.125\n' in rendered
+    assert 'tefillot_count 7\n' in rendered
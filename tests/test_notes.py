@@ -0,0 +1,37 @@
+from parse import TICKS_PER_WHOLE, MusicState
+from tokenizer import NotationError
+
+
+def music(notes, time='4/4'):
+    return MusicState({'notes': notes, 'time': time})
+
+
+def test_a_triplet_fills_exactly_one_beat():
+    c, d, e, f = music('&3c8 d e f4').music[:4]
+    assert [n.beat_ticks for n in (c, d, e)] == [0, TICKS_PER_WHOLE // 12, TICKS_PER_WHOLE // 6]
+    assert f.beat_ticks == TICKS_PER_WHOLE // 4
+
+
+def test_beams_break_at_the_half_bar():
+    # (the bar line ends the last beam, so its note needs no space)
+    notes = music('c8 d e f g a b c').music
+    assert [n.trailing_space for n in notes] == [False, False, False, True, False, False, False, False]
+
+
+def test_a_triplet_ending_on_the_half_bar_breaks_its_beam_there():
+    notes = music('c4 &3d8 e f g4').music
+    assert [n.trailing_space for n in notes] == [False, False, False, True, False]
+
+
+def test_a_backtick_breaks_a_beam():
+    assert [n.trailing_space for n in music('c8` d e f').music[:2]] == [True, False]
+
+
+def test_a_bad_duration_is_placed_at_its_column():
+    assert music('c4 d0 | e').diagnostics == [NotationError('0', 0, 4, source='duration')]
+    assert music('c4 | e8 f0.').diagnostics == [NotationError('0.', 1, 5, source='duration')]
+
+
+def test_a_bad_tuplet_is_placed_at_its_note():
+    diagnostics = music('c4 | d8 &4e8192 f').diagnostics
+    assert [(d.measure, d.column, d.source) for d in diagnostics] == [(1, 4, 'tuplet'), (1, 12, 'tuplet')]
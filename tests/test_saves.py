@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+import pytest
+
+from parse import ParsedPiece, latest_saves, load_parsed_music, merge_parsed
+from save_log import SaveLog
+
+YAML = '''Book: Siddur
+Composer: Traditional
+Music:
+  - title: Adon Olam
+    page: "1"
+    key: C
+    time: 4/4
+    notes: c4 d4 e4 f4
+    lyrics: A-don o-lam
+'''
+
+
+def piece(title, book, page, composer='?'):
+    return ParsedPiece(title=title, composer=composer, abc='', book=book, page=page,
+                       nb='', fk=None, pk=None)
+
+
+def save(title, book, page, composer):
+    return {'title': title, 'book': book, 'page': page, 'composer': composer,
+            'time': '4/4', 'key': 'C', 'notes': 'c4 d4 e4 f4'}
+
+
+def test_a_later_save_of_the_same_page_replaces_the_earlier_one():
+    saves = {'Adon Olam': [piece('Adon Olam', 'A', '1', 'first'),
+                           piece('Adon Olam', 'B', '7', 'other'),
+                           piece('Adon Olam', 'A', '1', 'second')]}
+    # and takes its place at the end, as it was saved last
+    assert [p.composer for p in latest_saves(saves)['Adon Olam']] == ['other', 'second']
+
+
+def test_saves_of_different_titles_are_kept_apart():
+    saves = {'Adon Olam': [piece('Adon Olam', 'A', '1')],
+             'Yigdal': [piece('Yigdal', 'A', '1')]}
+    assert latest_saves(saves) == saves
+
+
+def test_merge_parsed_appends_in_order():
+    parsed = defaultdict(list, {'Adon Olam': [piece('Adon Olam', 'A', '1', 'yaml')]})
+    merge_parsed(parsed, {'Adon Olam': [piece('Adon Olam', 'S', '2', 'saved')],
+                          'Yigdal': [piece('Yigdal', 'S', '3')]})
+    assert [p.composer for p in parsed['Adon Olam']] == ['yaml', 'saved']
+    assert [p.title for p in parsed['Yigdal']] == ['Yigdal']
+
+
+@pytest.mark.parametrize('use_cache', [True, False])
+def test_saves_come_after_the_yaml_and_only_the_latest_counts(workdir, use_cache):
+    (workdir / 'data' / 'siddur.yaml').write_text(YAML, encoding='utf-8')
+    log = SaveLog()
+    log.append(save('Adon Olam', 'Siddur', '1', 'first try'))
+    log.append(save('Yigdal', 'Siddur', '2', 'only'))
+    log.append(save('Adon Olam', 'Siddur', '1', 'second try'))
+
+    parsed = load_parsed_music(use_cache)
+    # a save doesn't replace a YAML piece, even for the same book and page
+    assert [p.composer for p in parsed['Adon Olam']] == ['Traditional', 'second try']
+    assert [p.composer for p in parsed['Yigdal']] == ['only']
+
+    log.compact()
+    assert load_parsed_music(use_cache) == parsed
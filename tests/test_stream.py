@@ -0,0 +1,38 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from bench import REPO, generate_catalog
+from catalog import write_tsv
+from parse import parse_music, stream_catalog
+
+
+@pytest.fixture(scope='module')
+def synthetic(tmp_path_factory):
+    ''' two copies of the real catalog, the second one mutated and linked
+        back to the first by FK, plus the real saves '''
+    root = tmp_path_factory.mktemp('catalog')
+    generate_catalog(root, scale=2)
+    shutil.copy(REPO / 'saves.json', root / 'saves.json')
+    return root
+
+
+@pytest.fixture
+def catalog_dir(synthetic, monkeypatch):
+    monkeypatch.chdir(synthetic)
+    return synthetic
+
+
+@pytest.mark.parametrize('run_size', [7, 100_000])
+def test_stream_catalog_matches_parse_music(catalog_dir, tmp_path, run_size):
+    # 7 spills dozens of runs to disk; 100_000 keeps it all in one
+    expected = list(parse_music(tsv_path=None, use_cache=False).groups())
+    assert list(stream_catalog(run_size, spill_dir=tmp_path)) == expected
+    assert not any(tmp_path.iterdir())   # the spilled runs are cleaned up
+
+
+def test_streamed_tsv_is_the_same_file(catalog_dir, tmp_path):
+    parse_music(tsv_path=tmp_path / 'built.tsv', use_cache=False)
+    write_tsv(tmp_path / 'streamed.tsv', stream_catalog(50, spill_dir=tmp_path / 'spill'))
+    assert (tmp_path / 'streamed.tsv').read_bytes() == (tmp_path / 'built.tsv').read_bytes()
@@ -0,0 +1,50 @@
+import pytest
+
+from titles import TitleIndex
+
+LINES = [
+    '# Arvit',
+    "V'Sham'ru",
+    "=V'shamru",
+    "L'cha Dodi",
+    'Lecha Dodi (Carlebach)',
+    'Shabbat Shalom',
+    'Tov Lehodot',
+    "Sh'lom Aleichem",
+    'Shalom Aleichem',
+]
+
+
+@pytest.fixture
+def index():
+    return TitleIndex(LINES)
+
+
+def test_exact_titles_resolve_to_themselves(index):
+    assert index.resolve("V'Sham'ru") == "V'Sham'ru"
+    assert index.resolve("L'cha Dodi") == "L'cha Dodi"
+
+
+def test_an_exact_alias_keeps_its_equals_sign(index):
+    assert index.resolve("V'shamru") == "=V'shamru"
+
+
+@pytest.mark.parametrize('title, line', [
+    ("V’Shamru", "V'Sham'ru"),       # smart quote, missing apostrophe
+    ('Lecha Dodi', "L'cha Dodi"),     # sh'va spelled out
+    ('Tov Lehodos', 'Tov Lehodot'),   # Ashkenazi final s
+    ('Shabat  shalom', 'Shabbat Shalom'),
+])
+def test_spelling_variants_resolve_to_their_line(index, title, line):
+    assert index.resolve(title) == line
+
+
+def test_the_first_of_two_lines_that_normalize_alike_wins(index):
+    assert index.resolve('Shlom Aleichem') == "Sh'lom Aleichem"
+    # but an exact match still finds its own line
+    assert index.resolve('Shalom Aleichem') == 'Shalom Aleichem'
+
+
+@pytest.mark.parametrize('title', ['# Arvit', 'Arvit', 'Adon Olam', ''])
+def test_headings_and_unknown_titles_resolve_to_none(index, title):
+    assert index.resolve(title) is None
@@ -0,0 +1,41 @@
+from tokenizer import NotationError, abc_to_notes, notes_errors, scan_notes
+
+
+def test_errors_are_placed_by_measure_and_column():
+    # columns count from the start of the measure, after its bar line
+    assert notes_errors('c4 d8 | e x4') == [NotationError('x', 1, 3), NotationError('4', 1, 4)]
+
+
+def test_bar_lines_restart_the_column_count():
+    assert notes_errors('c4 |\n| d? e') == [NotationError('?', 2, 2)]
+
+
+def test_errors_read_one_based():
+    assert str(NotationError('x', 1, 3)) == "unrecognised notes input 'x' at measure 2, column 4"
+
+
+def test_scan_notes_reports_the_same_errors():
+    for notes in ('c4 d8 | e x4', 'c4 |\n| d? e', '(c8 d e) | f2', 'c 4 x | d\t4 .'):
+        assert scan_notes(notes)[1] == notes_errors(notes)
+
+
+def test_scan_notes_tuples():
+    measures, errors = scan_notes('(&3c8 ^d+ e) | r4.`')
+    assert measures == [
+        [('(', '&3', '', 'c', '8', '', ''), ('', '', '^', 'd+', '', '', ''), ('', '', '', 'e', '', ')', '')],
+        [('', '', '', 'r', '4.', '', '`')],
+    ]
+    assert errors == []
+
+
+def test_spaces_inside_a_note_are_ignored():
+    assert scan_notes('c 4 . d8') == scan_notes('c4. d8')
+    assert scan_notes('& 3c8') == scan_notes('&3c8')
+    assert scan_notes('c1 6 d') == scan_notes('c16 d')
+    assert notes_errors('c1 6 d') == []
+
+
+def test_abc_errors_are_placed_too():
+    notes, errors = abc_to_notes('C2 D2 | E5/2 F2')
+    assert notes == 'c4`d4`|e8`f4'
+    assert errors == [NotationError('E5/2', 1, 1, 'notes_abc')]
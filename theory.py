@@ -0,0 +1,77 @@
+''' small bits of music theory shared by the engraver, MIDI writer and search '''
+
+from fractions import Fraction
+
+LETTERS = 'cdefgab'
+
+# number of sharps (positive) or flats (negative) in each key signature
+KEY_SIGNATURES = {
+    'C': 0, 'G': 1, 'D': 2, 'A': 3, 'E': 4, 'B': 5, 'F#': 6, 'C#': 7,
+    'F': -1, 'Bb': -2, 'Eb': -3, 'Ab': -4, 'Db': -5, 'Gb': -6, 'Cb': -7,
+    'Am': 0, 'Em': 1, 'Bm': 2, 'F#m': 3, 'C#m': 4, 'G#m': 5, 'D#m': 6, 'A#m': 7,
+    'Dm': -1, 'Gm': -2, 'Cm': -3, 'Fm': -4, 'Bbm': -5, 'Ebm': -6, 'Abm': -7,
+}
+
+SHARP_ORDER = 'fcgdaeb'
+FLAT_ORDER = 'beadgcf'
+
+SEMITONES = {'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7, 'a': 9, 'b': 11}
+
+
+def key_signature(key: str | None) -> int:
+    if not key:
+        return 0
+    return KEY_SIGNATURES.get(str(key).strip(), 0)
+
+
+def key_accidentals(key: str | None) -> dict[str, int]:
+    ''' {letter: +1 or -1} for the letters the key signature alters '''
+    count = key_signature(key)
+    if count > 0:
+        return {letter: 1 for letter in SHARP_ORDER[:count]}
+    return {letter: -1 for letter in FLAT_ORDER[:-count]}
+
+
+def diatonic_step(octave: int, letter: str) -> int:
+    ''' c4 (middle C) is 28; one per staff position '''
+    return octave * 7 + LETTERS.index(letter)
+
+
+def duration_fraction(duration: str) -> Fraction:
+    ''' '4' -> 1/4, '8.' -> 3/16, '2..' -> 7/16, as a fraction of a whole note '''
+    base = Fraction(1, int(duration.rstrip('.')))
+    dots = len(duration) - len(duration.rstrip('.'))
+    return base * (2 - Fraction(1, 2 ** dots))
+
+
+def accidental_offset(note_name: str) -> int | None:
+    ''' semitone offset written on the note itself, or None if unmarked '''
+    if note_name.endswith('+'):
+        return 1
+    if note_name.endswith('-'):
+        return -1
+    if note_name.endswith('@'):
+        return 0
+    return None
+
+
+def midi_pitches(music, key: str | None) -> list[int | None]:
+    ''' the MIDI note number of each Note (c4, middle C, is 60), or None
+        for a rest; an accidental lasts until the end of its measure '''
+    signature = key_accidentals(key)
+    carried = {}
+    pitches = []
+    for note in music:
+        letter = note.note_name[0]
+        if letter == 'r':
+            pitches.append(None)
+        else:
+            offset = accidental_offset(note.note_name)
+            if offset is None:
+                offset = carried.get((note.octave, letter), signature.get(letter, 0))
+            else:
+                carried[(note.octave, letter)] = offset
+            pitches.append((note.octave + 1) * 12 + SEMITONES[letter] + offset)
+        if note.trailing_bar:
+            carried = {}
+    return pitches
@@ -0,0 +1,83 @@
+''' match titles across transliterations, so incipits.txt needs far fewer =alias lines
+
+    normalize_title() folds the usual variants together: case, smart
+    quotes, apostrophes, hyphens and spaces, kh/ch/h, tz/ts, q/k, ei/e,
+    Ashkenazi final s for t (Lehodos, Shabbos), doubled letters, and
+    an 'e' standing for a sh'va between two consonants (L'chu, Lechu).
+'''
+
+from bisect import bisect_left
+import difflib
+import re
+import unicodedata
+
+QUOTES = str.maketrans({'’': "'", '‘': "'", 'ʼ': "'", '`': "'", '´': "'", '“': '"', '”': '"'})
+
+
+def normalize_title(title: str) -> str:
+    s = unicodedata.normalize('NFKD', title.translate(QUOTES)).lower()
+    s = ''.join(c for c in s if not unicodedata.combining(c))
+    s = re.sub(r"s\b", 't', s)                   # final sav
+    s = re.sub(r"[\s'\-.,!?\"]+", '', s)
+    s = s.replace('kh', 'h').replace('ch', 'h').replace('ts', 'tz').replace('q', 'k').replace('ei', 'e')
+    s = re.sub(r'(.)\1+', r'\1', s)
+    s = re.sub(r'(?<=[^aeiou])e(?=[^aeiou])', '', s)   # sh'va
+    s = re.sub(r'(.)\1+', r'\1', s)
+    return s
+
+
+def read_incipit_lines(path='incipits.txt') -> list[str]:
+    ''' the stripped lines of incipits.txt, first occurrence of each only '''
+    with open(path, encoding='utf-8') as inp:
+        return list(dict.fromkeys(row.strip() for row in inp))
+
+
+class TitleIndex:
+    ''' Every line of incipits.txt (headings aside), canonical or =alias,
+        by exact and normalized title.  Where two lines normalize alike,
+        the first one wins. '''
+
+    def __init__(self, lines: list[str]):
+        self.exact: set[str] = set()
+        self.normalized: dict[str, list[str]] = {}   # normalized -> lines
+        self.canonical: dict[str, str] = {}    # line -> the canonical title it files under
+        last = ''
+        for line in lines:
+            if line.startswith('# ') or not line:
+                continue
+            title = line[1:] if line.startswith('=') else line
+            if not line.startswith('='):
+                last = title
+            self.exact.add(title)
+            self.normalized.setdefault(normalize_title(title), []).append(line)
+            self.canonical.setdefault(line, last)
+        self.sorted_keys = sorted(self.normalized)
+
+    def resolve(self, title: str) -> str | None:
+        ''' the incipits.txt line `title` should be filed under, or None '''
+        if title in self.exact:
+            return '=' + title if '=' + title in self.canonical else title
+        lines = self.normalized.get(normalize_title(title))
+        return lines[0] if lines else None
+
+    def lookup(self, query: str, limit: int = 10) -> list[str]:
+        ''' canonical titles for the editor: prefix matches first, then
+            ones containing the query, then close misspellings '''
+        key = normalize_title(query)
+        found = []
+        i = bisect_left(self.sorted_keys, key)
+        while i < len(self.sorted_keys) and self.sorted_keys[i].startswith(key) and len(found) < limit:
+            found.append(self.sorted_keys[i])
+            i += 1
+        if len(found) < limit:
+            found.extend(k for k in self.sorted_keys if key in k and k not in found)
+        if len(found) < limit:
+            found.extend(k for k in difflib.get_close_matches(key, self.sorted_keys, n=limit, cutoff=0.6)
+                         if k not in found)
+        titles = []
+        for k in found:
+            for line in self.normalized[k]:
+                title = self.canonical[line]
+                if title not in titles:
+                    titles.append(title)
+        return titles[:limit]
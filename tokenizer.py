@@ -0,0 +1,231 @@
+''' single-pass tokenizers for the notes and lyrics mini-languages
+
+    See "Notation syntax" and "Lyrics" in the README.  Each token stream is
+    one compiled regex run once over the whole string; anything it doesn't
+    recognise comes back as a NotationError with its measure and column
+    instead of being silently skipped.
+
+    MusicState reads the notes through scan_notes, whose fast path lets the
+    C regex engine build each measure's note tuples; only a measure that
+    doesn't fully match is run through the positioned scanner, to say
+    where it went wrong.
+'''
+
+from dataclasses import dataclass
+from fractions import Fraction
+from itertools import islice
+import re
+from typing import Iterator, NamedTuple
+
+
+# Spaces inside a note are ignored, as they always have been: "c 4." is c4.
+NOTES_SCANNER = re.compile(r'''
+    (?P<note>(?![ ])
+        (?P<open_paren>\(?)[ ]*
+        (?P<triplet>&[ ]*\d)?[ ]*
+        (?P<octave>[\^v]?)[ ]*
+        (?P<pitch>[abcdefgr])[ ]*
+        (?P<accidental>[+@-]?)[ ]*
+        (?P<duration>\d*(?:[ ]+\d+)*)[ ]*
+        (?P<dot>\.?)[ ]*
+        (?P<close_paren>\)?)[ ]*
+        (?P<break_beam>`)?
+    )
+    | (?P<bar>\|)
+    | (?P<space>\s+)
+    | (?P<error>.)
+''', re.VERBOSE | re.DOTALL)
+
+# the pieces of a note, in the order they appear
+NOTE_PARTS = ('open_paren', 'triplet', 'octave', 'pitch', 'accidental',
+              'duration', 'dot', 'close_paren', 'break_beam')
+
+# the same note grammar, as the 7-tuples MusicState consumes, for a
+# measure with its spaces taken out
+NOTE_RE = re.compile(r'(\(?)((?:&\d)?)([\^v]?)([abcdefgr][+@-]?)(\d*\.?)(\)?)(`?)')
+
+# such a measure with nothing else in it (a note can only begin where the
+# last one ended, so a failed match gives up without much backtracking)
+VALID_MEASURE = re.compile(r'(?:\(?(?:&\d)?[\^v]?[abcdefgr][+@-]?\d*\.?\)?`?|\s)*')
+
+LYRICS_SCANNER = re.compile(r'''
+    (?P<syllable>[^\s|_-]*-)   # hyphens END a syllable
+    | (?P<extend>_)            # underscores ARE a syllable
+    | (?P<word>[^\s|_-]+)
+    | (?P<bar>\|)
+    | (?P<space>\s+)
+''', re.VERBOSE)
+
+SYLLABLE_RE = re.compile(r'[^\s|_-]*-|_|[^\s|_-]+')
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    measure: int
+    column: int
+
+
+@dataclass
+class NotationError:
+    text: str
+    measure: int  # 0-based, counting bar lines
+    column: int   # 0-based, from the start of the measure
+    source: str = 'notes'
+
+    def __str__(self):
+        return f"unrecognised {self.source} input {self.text!r} at measure {self.measure + 1}, column {self.column + 1}"
+
+
+def tokenize_notes(s: str) -> Iterator[Token]:
+    ''' typed tokens: each note is broken into its NOTE_PARTS (empty parts
+        are omitted), plus 'bar' and 'error' tokens '''
+    measure = 0
+    measure_start = 0
+    for m in NOTES_SCANNER.finditer(s):
+        kind = m.lastgroup
+        if kind == 'note':
+            for part in NOTE_PARTS:
+                text = m.group(part)
+                if text:
+                    yield Token(part, text, measure, m.start(part) - measure_start)
+        elif kind == 'bar':
+            yield Token('bar', '|', measure, m.start() - measure_start)
+            measure += 1
+            measure_start = m.end()
+        elif kind == 'error':
+            yield Token('error', m.group(), measure, m.start() - measure_start)
+
+
+def notes_errors(s: str) -> list[NotationError]:
+    return [NotationError(t.text, t.measure, t.column)
+            for t in tokenize_notes(s) if t.kind == 'error']
+
+
+def measure_errors(measure: str, measure_number: int) -> list[NotationError]:
+    return [NotationError(m.group(), measure_number, m.start())
+            for m in NOTES_SCANNER.finditer(measure) if m.lastgroup == 'error']
+
+
+def scan_notes(s: str) -> tuple[list[list[tuple[str, ...]]], list[NotationError]]:
+    ''' The fast path used by MusicState: one list per measure of
+        (open_paren, triplet, octave, note_name, duration, close_paren, break_beam)
+        tuples, plus whatever couldn't be read. '''
+    measures = []
+    errors = []
+    for measure_number, measure in enumerate(s.split('|')):
+        packed = measure.replace(' ', '')
+        measures.append(NOTE_RE.findall(packed))
+        if not VALID_MEASURE.fullmatch(packed):
+            errors.extend(measure_errors(measure, measure_number))
+    return measures, errors
+
+
+def note_column(s: str, measure_number: int, index: int, part: str | None = None) -> int:
+    ''' where the index-th note of a measure (or one of its NOTE_PARTS)
+        starts, for an error found only once the notes have been read '''
+    measure = s.split('|')[measure_number]
+    notes = (m for m in NOTES_SCANNER.finditer(measure) if m.lastgroup == 'note')
+    m = next(islice(notes, index, None))
+    return m.start(part) if part and m.group(part) else m.start()
+
+
+def tokenize_lyrics(s: str) -> Iterator[Token]:
+    measure = 0
+    measure_start = 0
+    for m in LYRICS_SCANNER.finditer(s):
+        kind = m.lastgroup
+        if kind == 'space':
+            continue
+        yield Token(kind, m.group(), measure, m.start() - measure_start)
+        if kind == 'bar':
+            measure += 1
+            measure_start = m.end()
+
+
+def scan_lyrics(s: str | None) -> list[list[str]]:
+    ''' one list of syllables per measure '''
+    if s is None:
+        return [['']]
+    return [SYLLABLE_RE.findall(m) for m in s.split('|')]
+
+
+# the small subset of ABC used by legacy `notes_abc` pieces
+ABC_SCANNER = re.compile(r'''
+    (?P<triplet>\(\d)
+    | (?P<note>
+        (?P<open_paren>\(?)
+        (?P<accidental>\^|_|=)?
+        (?P<pitch>[A-Ga-gz])
+        (?P<octave>[,']*)
+        (?P<num>\d*)
+        (?P<slash>/?)
+        (?P<den>\d*)
+        (?P<close_paren>\)?)
+    )
+    | (?P<bar>\|)
+    | (?P<space>\s+)
+    | (?P<error>.)
+''', re.VERBOSE | re.DOTALL)
+
+ABC_ACCIDENTALS = {'^': '+', '_': '-', '=': '@'}
+
+# note length as a fraction of an eighth (L:1/8) -> our duration
+ABC_LENGTHS = {
+    (8, 1): '1', (4, 1): '2', (2, 1): '4', (1, 1): '8', (1, 2): '16', (1, 4): '32',
+    (6, 1): '2.', (3, 1): '4.', (3, 2): '8.', (3, 4): '16.',
+}
+
+
+def abc_to_notes(s: str) -> tuple[str, list[NotationError]]:
+    ''' Translate a notes_abc string (L:1/8) into our own notes syntax,
+        so legacy pieces get a note list like everything else. '''
+    out = []
+    errors = []
+    octave = 4
+    triplet = ''
+    measure = 0
+    measure_start = 0
+    for m in ABC_SCANNER.finditer(s):
+        kind = m.lastgroup
+        column = m.start() - measure_start
+        if kind == 'triplet':
+            triplet = '&' + m.group()[1:]
+        elif kind == 'note':
+            pitch = m.group('pitch')
+            if m.group('slash'):
+                length = Fraction(int(m.group('num') or 1), int(m.group('den') or 2))
+            else:
+                length = Fraction(int(m.group('num') or 1))
+            duration = ABC_LENGTHS.get((length.numerator, length.denominator))
+            if duration is None:
+                errors.append(NotationError(m.group(), measure, column, 'notes_abc'))
+                duration = '8'
+            if pitch == 'z':
+                out.append(f"{m.group('open_paren')}{triplet}r{duration}{m.group('close_paren')}")
+                triplet = ''
+                continue
+            target = (4 if pitch.isupper() else 5) + m.group('octave').count("'") - m.group('octave').count(',')
+            shift = ''
+            if target == octave + 1:
+                shift = '^'
+            elif target == octave - 1:
+                shift = 'v'
+            elif target != octave:
+                # our syntax moves one octave per note
+                errors.append(NotationError(m.group(), measure, column, 'notes_abc'))
+                target = octave
+            octave = target
+            accidental = ABC_ACCIDENTALS.get(m.group('accidental') or '', '')
+            out.append(f"{m.group('open_paren')}{triplet}{shift}{pitch.lower()}{accidental}{duration}{m.group('close_paren')}")
+            triplet = ''
+        elif kind == 'bar':
+            out.append('|')
+            measure += 1
+            measure_start = m.end()
+        elif kind == 'space':
+            if out and out[-1] != '|':
+                out[-1] += '`'
+        else:
+            errors.append(NotationError(m.group(), measure, column, 'notes_abc'))
+    return ''.join(out), errors
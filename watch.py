@@ -0,0 +1,157 @@
+''' watch mode for the dev server: push just the edited rows to open pages
+
+    python app.py --watch
+
+A thread polls data/*.yaml, incipits.txt and saves.json a few times a
+second.  When one changes, LiveCatalog re-parses only that file (or folds
+in only the new saves), the new catalog is compared row by row with the
+last one, and the rows whose content changed are rendered on their own
+and sent, over the /events server-sent-events stream, to every open page,
+which swaps them in and engraves just those staves.  When rows were
+added, removed or moved, the new order of row keys goes along too.
+
+Every update moves the watcher to a new generation.  A page knows the
+generation it was rendered at, and reloads itself if it ever misses one.
+'''
+
+import json
+import queue
+import threading
+import time
+
+from metrics import metrics
+from midi import MIDI_DIR, write_midi_file
+from page_cache import input_fingerprint
+from render import incipit_row, row_keys, section_row, version_row
+
+POLL_INTERVAL = 0.25  # seconds
+KEEPALIVE = 15        # seconds between comments on an idle stream
+
+
+def row_signatures(catalog, keys) -> tuple[list[str], dict[str, tuple]]:
+    ''' (row keys in page order, {key: (what the row shows, the row's object)}) '''
+    order = []
+    rows = {}
+    for section in catalog.sections:
+        if section.title is not None:
+            key = keys[id(section)]
+            order.append(key)
+            rows[key] = (section.title, section)
+        for incipit in section.incipits:
+            key = keys[id(incipit)]
+            order.append(key)
+            rows[key] = (incipit.title, incipit)
+            for version in incipit.versions:
+                key = keys[id(version)]
+                order.append(key)
+                rows[key] = ((version.composer, version.abc, version.source_html()), version)
+    return order, rows
+
+
+class CatalogWatcher:
+    def __init__(self, live_catalog, midi_url=lambda name: f'{MIDI_DIR.as_posix()}/{name}'):
+        self.live_catalog = live_catalog
+        self.midi_url = midi_url
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.catalog = None
+        self.fingerprint = None
+        self.order: list[str] = []
+        self.rows: dict[str, tuple] = {}
+        # pushed rows are numbered above anything an open page has used
+        self.next_number = 1
+        self.subscribers: list[queue.Queue] = []
+        self.thread = None
+        self.problems: list[str] = []
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.poll, name='catalog-watcher', daemon=True)
+                self.thread.start()
+
+    def poll(self) -> None:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"watch: {e}")
+                self.publish('problem', {'errors': [str(e)]})
+
+    def check(self):
+        ''' (catalog, generation), after pushing any change to the inputs '''
+        with self.lock:
+            fingerprint = input_fingerprint()
+            if fingerprint == self.fingerprint and self.catalog is not None:
+                return self.catalog, self.generation
+            # (set first, so a refresh that fails isn't retried until the inputs change again)
+            self.fingerprint = fingerprint
+            with metrics.span('watch_update'):
+                catalog = self.live_catalog.refresh()
+                order, rows = row_signatures(catalog, row_keys(catalog))
+                if self.catalog is not None and self.push(order, rows):
+                    self.generation += 1
+                self.catalog, self.order, self.rows = catalog, order, rows
+                last = max((v.number for v in catalog.versions()), default=0)
+                self.next_number = max(self.next_number, last + 1)
+            if self.live_catalog.errors != self.problems:
+                # (an empty list clears the page's banner)
+                self.problems = self.live_catalog.errors
+                self.publish('problem', {'errors': self.problems})
+            return self.catalog, self.generation
+
+    def take_number(self) -> int:
+        self.next_number += 1
+        return self.next_number - 1
+
+    def push(self, order, rows) -> bool:
+        ''' send the rows that differ from the last catalog; False if none do '''
+        changed = {key: obj for key, (signature, obj) in rows.items()
+                   if self.rows.get(key, (None,))[0] != signature}
+        if not changed and order == self.order:
+            return False
+        html = {}
+        tunes = {}
+        for key, obj in changed.items():
+            if key.startswith('s:'):
+                html[key] = section_row(obj.title, key)
+            elif key.startswith('i:'):
+                html[key] = incipit_row(obj.title, f'i{self.take_number()}', key)
+            else:
+                number = self.take_number()
+                midi_name = write_midi_file(obj.music_fields) if obj.music_fields else None
+                html[key] = version_row(obj, True, tunes, number,
+                                        self.midi_url(midi_name) if midi_name else None, key)
+        print(f"watch: {len(changed)} rows changed" + (", order changed" if order != self.order else ''))
+        self.publish('rows', {
+            'from': self.generation,
+            'to': self.generation + 1,
+            'rows': html,
+            'tunes': tunes,
+            'order': order if order != self.order else None,
+            'files': [p.as_posix() for p in self.live_catalog.changed],
+        })
+        return True
+
+    def publish(self, event: str, data: dict) -> None:
+        message = f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+        for subscriber in list(self.subscribers):
+            subscriber.put(message)
+
+    def stream(self, generation: int | None):
+        ''' the text/event-stream for one page, rendered at `generation` '''
+        self.start()
+        subscriber = queue.Queue()
+        self.subscribers.append(subscriber)
+        try:
+            if generation != self.generation:
+                yield 'event: reload\ndata: {}\n\n'
+                return
+            while True:
+                try:
+                    yield subscriber.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.subscribers.remove(subscriber)